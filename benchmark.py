@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+# Format this file with python3 -m autopep8 -i benchmark.py
+
+# Measures query.py and device_id.py on synthetic reports (see
+# synthetic_reports.py), to tell whether a change makes them faster.
+#
+#   python3 benchmark.py [--reports 1000,10000] [--jobs N] [--repeat R]
+#                        [--seed S] [--compress gzip|zstd] [--compare OLD.csv]
+#
+# For each number of reports, a corpus is generated in cache/benchmark/ (and
+# kept there for later runs). Then each of these is run in a fresh process,
+# with its output discarded:
+#   cold       query.py with no report store or result cache, so every report
+#              is parsed and every requirement evaluated
+#   warm       query.py again, with the report store up to date
+#   device_id  device_id.py, with the report store up to date
+# Each is timed end to end, along with its peak RSS (not counting worker
+# processes). The query.py runs also save a --profile-trace, from which the
+# load, parse, evaluate and analysis stages and the total time spent in the
+# stock requirements are taken. With --repeat R, the fastest of R runs is kept.
+#
+# The results are printed and saved to benchmark-<timestamp>.csv, with the
+# commit they were measured at. Pass --compare with an earlier one to see the
+# change in each time.
+
+import csv
+import getopt
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+import report_store
+import synthetic_reports
+
+BENCHMARK_DIR = os.path.join('cache', 'benchmark')
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS = ['cold', 'warm', 'device_id']
+# Stages of the --profile-trace totals in the results
+STAGES = ['load', 'load/parse', 'evaluate', 'analysis']
+TIMED_FIELDS = ['seconds'] + [stage.replace('/', '_') for stage in STAGES] + ['requirements']
+FIELDS = (['commit', 'python', 'reports', 'jobs', 'run', 'seconds', 'reports_per_second',
+           'peak_rss_mb'] + TIMED_FIELDS[1:])
+
+
+def commit():
+    '''The current commit, with a + if there are uncommitted changes'''
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                cwd=SCRIPT_DIR, capture_output=True, text=True).stdout
+        return rev + ('+' if status.strip() else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def corpus(n, seed, compression):
+    '''
+    The directory of a generated corpus of n reports, laid out like the
+    repository (data/reports, cache, third_party) so the scripts can run in it
+    '''
+    name = '{}-seed{}{}'.format(n, seed, '-' + compression if compression else '')
+    directory = os.path.abspath(os.path.join(BENCHMARK_DIR, name))
+    done = os.path.join(directory, 'generated')
+    if not os.path.exists(done):
+        shutil.rmtree(directory, ignore_errors=True)
+        synthetic_reports.generate(n, os.path.join(directory, 'data', 'reports'), seed,
+                                   compression=compression)
+        os.symlink(os.path.join(SCRIPT_DIR, 'third_party'),
+                   os.path.join(directory, 'third_party'))
+        open(done, 'w').close()
+    return directory
+
+
+def run_script(directory, args):
+    '''Run a script in directory; (seconds, peak RSS in bytes or None)'''
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + args, cwd=directory,
+                               stdout=subprocess.DEVNULL)
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        # ru_maxrss is in kilobytes, except on macOS
+        rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    else:
+        process.wait()
+        seconds = time.perf_counter() - start
+        rss = None
+    if process.returncode != 0:
+        raise RuntimeError('{} failed in {}'.format(' '.join(args), directory))
+    return seconds, rss
+
+
+def measure(directory, run, jobs):
+    '''One run: seconds, peak RSS, and {stage: seconds} from its trace'''
+    trace_file = os.path.join(directory, 'cache', 'benchmark-trace.json')
+    if run == 'cold':
+        for f in ('report-store.pickle', 'report-store-formats.bin', 'query-results.pickle'):
+            if os.path.exists(os.path.join(directory, 'cache', f)):
+                os.remove(os.path.join(directory, 'cache', f))
+    if run == 'device_id':
+        seconds, rss = run_script(directory, [os.path.join(SCRIPT_DIR, 'device_id.py'),
+                                              '--jobs', str(jobs)])
+        return seconds, rss, {}
+
+    # --analyze, so that the analysis stage is measured too
+    seconds, rss = run_script(directory, [os.path.join(SCRIPT_DIR, 'query.py'), '--jobs', str(jobs),
+                                          '--analyze', '--profile-trace', trace_file])
+    for f in os.listdir(directory):
+        if f.startswith('result-'):
+            os.remove(os.path.join(directory, f))
+    with open(trace_file) as f:
+        trace = json.load(f)
+    stages = {}
+    for total in trace['totals']:
+        if total['category'] == 'stages' and total['name'] in STAGES:
+            stages[total['name']] = total['seconds']
+        elif total['category'] == 'requirements':
+            stages['requirements'] = stages.get('requirements', 0) + total['seconds']
+    return seconds, rss, stages
+
+
+def benchmark(sizes, jobs=1, repeat=1, seed=1, compression=None):
+    rows = []
+    rev = commit()
+    python = '{} {}'.format(platform.python_implementation(), platform.python_version())
+    for n in sizes:
+        directory = corpus(n, seed, compression)
+        for run in RUNS:
+            best = None
+            for _ in range(repeat):
+                result = measure(directory, run, jobs)
+                if best is None or result[0] < best[0]:
+                    best = result
+            seconds, rss, stages = best
+            load = stages.get('load', seconds)
+            row = [rev, python, n, jobs, run, round(seconds, 3), round(n / load) if load else '',
+                   round(rss / (1 << 20), 1) if rss else '']
+            row += [round(stages[stage], 3) if stage in stages else ''
+                    for stage in STAGES + ['requirements']]
+            rows.append(row)
+            print('{} reports, {}: {:.3f}s'.format(n, run, seconds))
+    return rows
+
+
+def compare(rows, old_file):
+    '''The change in each time since an earlier benchmark-*.csv'''
+    with open(old_file, newline='') as f:
+        old = {(row['reports'], row['jobs'], row['run']): row for row in csv.DictReader(f)}
+    result = 'Compared to {}:\n'.format(old_file)
+    for row in rows:
+        new = dict(zip(FIELDS, map(str, row)))
+        before = old.get((new['reports'], new['jobs'], new['run']))
+        if before is None:
+            continue
+        changes = []
+        for field in TIMED_FIELDS:
+            if before.get(field) and new[field] and float(new[field]):
+                changes.append('{} {}s -> {}s ({:.2f}x)'.format(
+                    field, before[field], new[field], float(before[field]) / float(new[field])))
+        result += '  {} reports, {} (was {}): {}\n'.format(
+            new['reports'], new['run'], before['commit'], ', '.join(changes))
+    return result
+
+
+if __name__ == '__main__':
+    sizes = [1000, 10000]
+    jobs = 1
+    repeat = 1
+    seed = 1
+    compression = None
+    compare_file = None
+    opts, args = getopt.getopt(sys.argv[1:], 'j:', [
+        'reports=', 'jobs=', 'repeat=', 'seed=', 'compress=', 'compare='])
+    for o, a in opts:
+        if o == '--reports':
+            sizes = [int(n) for n in a.split(',')]
+        elif o in ('-j', '--jobs'):
+            jobs = int(a)
+        elif o == '--repeat':
+            repeat = int(a)
+        elif o == '--seed':
+            seed = int(a)
+        elif o == '--compress':
+            try:
+                report_store.check_compression(a)
+            except ValueError as e:
+                print('--compress: {}'.format(e))
+                sys.exit(1)
+            compression = a
+        elif o == '--compare':
+            compare_file = a
+
+    rows = benchmark(sizes, jobs, repeat, seed, compression)
+
+    widths = [max(len(str(row[c])) for row in [FIELDS] + rows)
+              for c in range(len(FIELDS))]
+    result = ''
+    for row in [FIELDS] + rows:
+        result += '  '.join(str(v).rjust(w) for v, w in zip(row, widths)) + '\n'
+    if compare_file:
+        result += '\n' + compare(rows, compare_file)
+    print(result)
+
+    result_filename = 'benchmark-{}.csv'.format(time.strftime("%Y%m%d-%H%M%S"))
+    print('Benchmark saved to {}'.format(result_filename))
+    with open(result_filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
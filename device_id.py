@@ -7,15 +7,21 @@
 # patterns in that file and output devices which don't have a match. Useful for
 # updating the architecture mappings as described in
 # https://dawn.googlesource.com/dawn/+/refs/heads/main/src/dawn/updating_gpu_info.md
+# Devices which match more than one architecture are listed under the first one
+# in the file, and also reported separately.
+#
+# Pass --jobs N to parse new reports in N processes, and --source files to read
+# every report from its file instead of from the report store.
 
 from collections import defaultdict, namedtuple, OrderedDict
-import glob
 import json
 import time
 import re
 import sys
 import getopt
 
+import report_store
+
 class DeviceGroup:
     def __init__(self, devices, mask):
         self.mask = mask
@@ -60,6 +66,10 @@ class Vendor:
         self.name = ''
         self.devices = {}
         self.architectures = {}
+        # The names of the architectures with a pattern deviceId, by mask and
+        # then by pattern: a device matches the architectures in
+        # self.patterns[mask][deviceId & mask] for each mask.
+        self.patterns = defaultdict(lambda: defaultdict(list))
 
     def addDevice(self, deviceId, deviceName):
         if deviceId in self.devices:
@@ -75,49 +85,37 @@ class Vendor:
             self.architectures[name] = arch
 
         arch.addDeviceGroup(devices, mask)
-
-def collectDevices(vendors):
-    reports_filenames = glob.glob('data/reports/*.json')
-    reports_entries = sorted(map(lambda f: (
-        int(f[len('data/reports/'):-len('.json')]), f), reports_filenames))
-
-    print('Collecting device information from {} records...'.format(len(reports_entries)))
-
-    i = 0;
-    for report_id, filename in reports_entries:
-        i = i + 1
-        if (i % 1000 == 0):
-            print('Reading record {} of {} ({:.2f}%)'.format(i, len(reports_entries), (i / len(reports_entries)) * 100), end='\r')
-
-        report = None
-        with open(filename) as f:
-            try:
-                report = json.load(f)
-            except KeyboardInterrupt:
-                sys.exit(1)
-            except:
-                print('error parsing {}'.format(filename))
-                continue
-
-        properties = report['properties']
-
-        vendorId = 0
-        if 'vendorID' in properties:
-            vendorId = properties['vendorID']
-
-        deviceId = 0
-        if 'deviceID' in properties:
-            deviceId = properties['deviceID']
-
-        deviceName = '[unknown]'
-        if 'deviceName' in properties:
-            deviceName = properties['deviceName']
+        for deviceId in arch.deviceGroups[-1].deviceIds:
+            names = self.patterns[mask][deviceId]
+            if name not in names:
+                names.append(name)
+
+    def matchArchitectures(self, deviceId):
+        '''The names of every architecture matching deviceId, in file order'''
+        matches = set()
+        for mask, patterns in self.patterns.items():
+            matches.update(patterns.get(deviceId & mask, ()))
+        return [name for name in self.architectures if name in matches]
+
+def collectDevices(vendors, jobs=1, source='store'):
+    reports = report_store.reports(source, jobs=jobs)
+
+    print('Collecting device information...')
+
+    count = 0
+    for report_id, info in reports:
+        count += 1
+        vendorId = info.header.get('vendorID') or 0
+        deviceId = info.header.get('deviceID') or 0
+        deviceName = info.header.get('deviceName', '[unknown]')
 
         if not vendorId in vendors:
             vendors[vendorId] = Vendor(vendorId)
 
         vendors[vendorId].addDevice(deviceId, deviceName)
 
+    print('Collected device information from {} records'.format(count))
+
 def collectGpuInfo(vendors, gpuInfoPath):
     gpuInfoJson = None
     with open(gpuInfoPath) as f:
@@ -161,18 +159,24 @@ if __name__ == '__main__':
     vendors = {}
     useGpuInfo = False
 
-    opts, args = getopt.getopt(sys.argv[1:], 'a')
+    opts, args = getopt.getopt(sys.argv[1:], 'aj:', ['jobs=', 'source='])
 
     showAll = False
+    jobs = 1
+    source = 'store'
     for o, a in opts:
         if o == "-a":
             showAll = True
+        elif o in ('-j', '--jobs'):
+            jobs = int(a)
+        elif o == '--source':
+            source = a
 
     if (len(args) > 0):
         collectGpuInfo(vendors, args[0])
         useGpuInfo = True
 
-    collectDevices(vendors)
+    collectDevices(vendors, jobs, source)
 
     filteredEntries = 0
     totalEntries = 0
@@ -180,6 +184,9 @@ if __name__ == '__main__':
     filteredDevices = 0
     totalDevices = 0
 
+    # (vendor, deviceId, names of the architectures it matches)
+    ambiguous = []
+
     if useGpuInfo:
         print('\n=== The following devices have a corresponding entry in GPUInfo ===')
 
@@ -189,19 +196,37 @@ if __name__ == '__main__':
 
             print('\n{} VendorId: 0x{:04x}'.format(vendor.name, vendorId))
 
-            for (archName, arch) in vendor.architectures.items():
-                archMatches = [deviceId for deviceId in vendor.devices if arch.matchDeviceId(deviceId)]
-                archMatches.sort()
-                filteredDevices += len(archMatches)
+            # Classify every device in one pass. A device matching more than
+            # one architecture is listed under the first, and reported below.
+            archMatches = defaultdict(list)
+            for deviceId in sorted(vendor.devices):
+                matches = vendor.matchArchitectures(deviceId)
+                if matches:
+                    archMatches[matches[0]].append(deviceId)
+                if len(matches) > 1:
+                    ambiguous.append((vendor, deviceId, matches))
+
+            for archName in vendor.architectures:
+                archMatches[archName].sort()
+                filteredDevices += len(archMatches[archName])
 
                 print(' - {}'.format(archName))
 
-                for deviceId in archMatches:
+                for deviceId in archMatches[archName]:
                     device = vendor.devices[deviceId]
                     filteredEntries += device.count
                     for name in device.names:
                         print('     + DeviceId: 0x{:04x}, {}'.format(deviceId, name))
-                    del vendor.devices[deviceId]
+
+            matched = set(deviceId for deviceIds in archMatches.values() for deviceId in deviceIds)
+            vendor.devices = {deviceId: device for deviceId, device in vendor.devices.items()
+                              if deviceId not in matched}
+
+        if ambiguous:
+            print('\n=== The following devices match more than one architecture in GPUInfo ===\n')
+            for vendor, deviceId, matches in ambiguous:
+                print('{} DeviceId: 0x{:04x}, listed under {}, also matches {}'.format(
+                    vendor.name, deviceId, matches[0], ', '.join(matches[1:])))
 
         totalDevices += filteredDevices
         totalEntries += filteredEntries
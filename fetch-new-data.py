@@ -5,12 +5,23 @@
 # Please be nice to the operator of the server and use the existing data to
 # avoid re-scraping all of the data that's been scraped already. :)
 
-import urllib.request
+import getopt
+import glob
 import json
 import os
 import re
 import sys
-import time
+import urllib.parse
+
+import fetcher
+import report_store
+
+JOURNAL_FILE = os.path.join('cache', 'fetch-journal.jsonl')
+# Fields of the report list which may hold a report's submission date, which
+# is saved for query.py --trend and --since. The report list API isn't
+# documented, so these are likely names for the field rather than known ones;
+# if the list has none of them, a warning lists the fields it does have.
+SUBMISSION_DATE_FIELDS = ('submissiondate', 'submitted', 'date')
 
 
 def clean_json(s):
@@ -21,12 +32,116 @@ def clean_json(s):
     return re.sub(r'[\r\n\t]+ *', ' ', s)
 
 
-def report_file(report_id):
-    return os.path.join('data', 'reports', str(report_id) + '.json')
+def report_file(report_id, compression=None):
+    return os.path.join('data', 'reports', str(report_id)) + report_store.COMPRESSION_SUFFIXES[compression]
+
+
+def existing_report_file(report_id):
+    '''The file holding a report, with whichever compression, or None'''
+    for compression in report_store.COMPRESSION_SUFFIXES:
+        filename = report_file(report_id, compression)
+        if os.path.exists(filename):
+            return filename
+    return None
 
 
 def exists_and_not_empty(filename):
-    return os.path.exists(filename) and os.stat(filename).st_size != 0
+    return filename is not None and os.path.exists(filename) and os.stat(filename).st_size != 0
+
+
+def is_valid_json(filename):
+    try:
+        with report_store.open_report(filename) as f:
+            json.load(f)
+        return True
+    except (ValueError, OSError, EOFError):
+        return False
+
+
+def with_server(url, server):
+    '''url, but on a different server (e.g. a local stand-in for testing)'''
+    if not server:
+        return url
+    parts = urllib.parse.urlsplit(url)
+    base = urllib.parse.urlsplit(server)
+    return urllib.parse.urlunsplit(parts._replace(scheme=base.scheme, netloc=base.netloc))
+
+
+class Journal:
+    '''
+    Records which reports have been completed, have failed, or are still
+    pending, so that an interrupted run can pick up where it left off without
+    looking at every report file again. It is a log of JSON lines, where the
+    last line for a report id wins.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.status = {}
+        self.urls = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line may have been cut off by a crash.
+                        continue
+                    self.status[entry['id']] = entry['status']
+                    if 'url' in entry:
+                        self.urls[entry['id']] = entry['url']
+        self._compact()
+        self.f = open(filename, 'a')
+
+    def _compact(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with open(self.filename + '.tmp', 'w') as f:
+            for report_id, status in sorted(self.status.items()):
+                f.write(self._line(report_id, status))
+        os.replace(self.filename + '.tmp', self.filename)
+
+    def _line(self, report_id, status):
+        entry = {'id': report_id, 'status': status}
+        if status == 'pending':
+            entry['url'] = self.urls[report_id]
+        return json.dumps(entry) + '\n'
+
+    def record(self, report_id, status, url=None):
+        if url:
+            self.urls[report_id] = url
+        self.status[report_id] = status
+        self.f.write(self._line(report_id, status))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def record_many(self, report_ids, status):
+        '''
+        Record the same status for many reports, flushed to disk once. For
+        backfilling reports which are already on disk, where losing the
+        records to a crash only means checking the files again.
+        '''
+        if not report_ids:
+            return
+        for report_id in report_ids:
+            self.status[report_id] = status
+            self.f.write(self._line(report_id, status))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def ids(self, status):
+        return sorted(i for i, s in self.status.items() if s == status)
+
+
+def write_report(report_id, text, compression=None):
+    '''
+    Atomically write a report: it's validated, written to a temporary file
+    and renamed into place, so a report file is never partially written.
+    '''
+    try:
+        json.loads(text)
+    except ValueError as ex:
+        raise fetcher.FetchError('invalid JSON: {}'.format(ex))
+    return report_store.write_report(os.path.join('data', 'reports', str(report_id)), text, compression)
 
 
 if __name__ == '__main__':
@@ -34,49 +149,115 @@ if __name__ == '__main__':
         print("Run this script from outside the data repository.")
         sys.exit(1)
 
+    # --concurrency N: number of requests in flight at once
+    # --rate R: maximum requests per second, over all connections
+    # --server URL: fetch from URL instead of https://vulkan.gpuinfo.org
+    # --retry-failed: try again to get reports which failed permanently (e.g.
+    #   404 Not Found) in an earlier run
+    # --compress gzip|zstd: save new reports compressed
+    concurrency = fetcher.DEFAULT_CONCURRENCY
+    rate = fetcher.DEFAULT_RATE
+    server = None
+    retry_failed = False
+    compression = None
+    opts, args = getopt.getopt(sys.argv[1:], '', [
+        'concurrency=', 'rate=', 'server=', 'retry-failed', 'compress='])
+    for o, a in opts:
+        if o == '--concurrency':
+            concurrency = int(a)
+        elif o == '--rate':
+            rate = float(a)
+        elif o == '--server':
+            server = a
+        elif o == '--retry-failed':
+            retry_failed = True
+        elif o == '--compress':
+            try:
+                report_store.check_compression(a)
+            except ValueError as e:
+                print('--compress: {}'.format(e))
+                sys.exit(1)
+            compression = a
+
     HEADERS = {
         'User-Agent': 'kainino0x/gpuinfo-vulkan-query',
     }
+    f = fetcher.Fetcher(HEADERS, concurrency=concurrency, rate=rate)
+    journal = Journal(JOURNAL_FILE)
+
+    # Leftovers from writes which were interrupted
+    for tmp in glob.glob(os.path.join('data', 'reports', '*.tmp')):
+        os.remove(tmp)
+
+    def save_report(report_id, body):
+        filename = write_report(report_id, clean_json(
+            body.decode('utf-8')), compression)
+        journal.record(report_id, 'completed')
+        print('Got {}'.format(filename))
 
-    with urllib.request.urlopen(
-            urllib.request.Request(
-                'https://vulkan.gpuinfo.org/api/v2/getreportlist.php',
-                headers=HEADERS)) as resp:
-        report_list = json.loads(clean_json(resp.read().decode('utf-8')))
+    # Reports already tried in this run, which aren't tried again if they
+    # failed and are still pending
+    attempted = set()
+
+    def get_reports(reports_to_get):
+        for report_id, url in reports_to_get:
+            journal.record(report_id, 'pending', url)
+            attempted.add(report_id)
+        failures = f.fetch_all(reports_to_get, save_report)
+        for report_id, ex in failures:
+            # Transient failures stay pending, to be retried next time.
+            if ex.permanent:
+                journal.record(report_id, 'failed')
+        return failures
+
+    # Finish what an interrupted run started before asking for the list.
+    pending = journal.ids('pending')
+    if len(pending):
+        print("Resuming {} pending reports".format(len(pending)))
+        get_reports([(report_id, journal.urls[report_id])
+                     for report_id in pending])
+
+    report_list = json.loads(clean_json(f.fetch(with_server(
+        'https://vulkan.gpuinfo.org/api/v2/getreportlist.php', server)).decode('utf-8')))
 
     print("Found {} reports".format(len(report_list)))
 
     reports_to_get = []
+    backfilled = []
+    dates = report_store.load_dates()
+    dates_changed = False
     for report in report_list:
         report_id = int(report['url'].split('=')[1])
-        if not exists_and_not_empty(report_file(report_id)):
-            reports_to_get.append((report_id, report['url']))
+        date = next((report[k] for k in SUBMISSION_DATE_FIELDS if report.get(k)), None)
+        if date and dates.get(report_id) != date:
+            dates[report_id] = date
+            dates_changed = True
+
+        status = journal.status.get(report_id)
+        if status == 'completed' or (status == 'failed' and not retry_failed) or report_id in attempted:
+            continue
+        if status is None:
+            # Not seen by a journaled run yet: check what's on disk once. Older
+            # versions of this script could leave empty or truncated files
+            # behind, so the whole report is decoded.
+            filename = existing_report_file(report_id)
+            if exists_and_not_empty(filename) and is_valid_json(filename):
+                backfilled.append(report_id)
+                continue
+        reports_to_get.append((report_id, with_server(report['url'], server)))
+    journal.record_many(backfilled, 'completed')
+
+    if dates_changed:
+        report_store.save_dates(dates)
+    if report_list and not any(report.get(k) for report in report_list for k in SUBMISSION_DATE_FIELDS):
+        print('Warning: the report list has no submission dates (looked for {}; it has {}), '
+              'so query.py --trend and --since have none to go by.'.format(
+                  ', '.join(SUBMISSION_DATE_FIELDS), ', '.join(sorted(report_list[0]))))
 
     print("Need to get {} more reports".format(len(reports_to_get)))
 
-    for report_id, url in reports_to_get:
-        filename = report_file(report_id)
-        print('Getting {}'.format(filename))
-
-        with open(filename, 'w') as f:
-            while True:
-                try:
-                    resp = urllib.request.urlopen(urllib.request.Request(url, headers=HEADERS))
-                    break
-                except urllib.error.HTTPError as ex:
-                    print(ex.reason)
-                    if ex.code == 429:  # Too Many Requests
-                        time.sleep(2.0)
-                        continue
-                    elif ex.code == 500:  # Internal Server Error
-                        time.sleep(5.0)
-                        continue
-                    else:
-                        raise
-            with resp:
-                s = resp.read().decode('utf-8')
-                f.write(clean_json(s))
-
-        # Be nice to the server and don't scrape too aggressively.
-        # (This number seems to mostly just avoid hitting Too Many Requests.)
-        time.sleep(0.7)
+    failures = get_reports(reports_to_get)
+    if failures:
+        print('Failed to get {} reports: {}'.format(
+            len(failures), ' '.join(str(report_id) for report_id, _ in sorted(failures))))
+        sys.exit(1)
@@ -0,0 +1,202 @@
+# Format this file with python3 -m autopep8 -i fetcher.py
+
+# Concurrent, rate-limited HTTP fetching for fetch-new-data.py.
+#
+# Requests are spread over a few workers, each of which keeps its own
+# keep-alive connection open. A token bucket shared by all of the workers caps
+# the request rate, and a 429 (Too Many Requests) or 5xx response makes every
+# worker back off: for as long as the Retry-After header asks, or otherwise
+# exponentially, with jitter.
+
+import asyncio
+import email.utils
+import http.client
+import random
+import time
+import urllib.parse
+
+# Be nice to the server: by default this is about as fast as the old
+# one-at-a-time fetching with a 0.7s sleep between reports.
+DEFAULT_CONCURRENCY = 2
+DEFAULT_RATE = 1.5  # requests per second
+
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+
+
+class FetchError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        # HTTP status of the last attempt, if there was a response
+        self.status = status
+
+    @property
+    def permanent(self):
+        '''Whether retrying later is pointless (e.g. 404 Not Found)'''
+        return self.status is not None and self.status != 429 and self.status < 500
+
+
+class TokenBucket:
+    '''Allows `rate` requests per second on average, in bursts of up to `burst`.'''
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_after(headers):
+    '''Seconds to wait according to a Retry-After header, or None'''
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Connection:
+    '''A keep-alive connection to one server. get() blocks.'''
+
+    def __init__(self, netloc, scheme, headers, timeout):
+        if scheme == 'https':
+            self.conn = http.client.HTTPSConnection(netloc, timeout=timeout)
+        else:
+            self.conn = http.client.HTTPConnection(netloc, timeout=timeout)
+        self.headers = headers
+
+    def get(self, url):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        for attempt in range(2):
+            try:
+                self.conn.request('GET', path, headers=self.headers)
+                resp = self.conn.getresponse()
+                return resp.status, resp.reason, resp.headers, resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed the idle connection; reconnect once.
+                self.conn.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        self.conn.close()
+
+
+class Fetcher:
+    def __init__(self, headers, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                 max_retries=8, timeout=60):
+        self.headers = headers
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.resume_at = 0
+
+    async def get(self, connections, url):
+        '''GET url using (and adding to) a worker's connections, with retries'''
+        parts = urllib.parse.urlsplit(url)
+        if parts.netloc not in connections:
+            connections[parts.netloc] = Connection(
+                parts.netloc, parts.scheme, self.headers, self.timeout)
+        conn = connections[parts.netloc]
+
+        attempt = 0
+        while True:
+            delay = self.resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            await self.bucket.acquire()
+
+            try:
+                status, reason, headers, body = await asyncio.to_thread(conn.get, url)
+            except (OSError, http.client.HTTPException) as ex:
+                conn.close()
+                status, reason, headers, body = None, str(ex), None, None
+
+            if status == 200:
+                return body
+            if status is not None and status != 429 and status < 500:
+                raise FetchError('{} {}'.format(status, reason), status)
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise FetchError('{} {} (gave up after {} attempts)'.format(
+                    status, reason, attempt), status)
+            delay = retry_after(headers)
+            if delay is None:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.5)
+            print('{}: {} {}, retrying in {:.1f}s'.format(url, status, reason, delay))
+            # Every worker backs off, not just this one.
+            self.resume_at = max(self.resume_at, time.monotonic() + delay)
+
+    async def _worker(self, queue, handle, failures):
+        connections = {}
+        try:
+            while True:
+                try:
+                    key, url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    body = await self.get(connections, url)
+                except FetchError as ex:
+                    print('Failed to get {}: {}'.format(url, ex))
+                    failures.append((key, ex))
+                    continue
+                try:
+                    handle(key, body)
+                except FetchError as ex:
+                    print('Bad response for {}: {}'.format(url, ex))
+                    failures.append((key, ex))
+        finally:
+            for conn in connections.values():
+                conn.close()
+
+    async def _fetch_all(self, items, handle):
+        self.bucket = TokenBucket(self.rate)
+        queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+        failures = []
+        await asyncio.gather(*(self._worker(queue, handle, failures)
+                               for _ in range(self.concurrency)))
+        return failures
+
+    def fetch_all(self, items, handle):
+        '''
+        Fetch every (key, url) in items, calling handle(key, body) as each one
+        arrives (in whatever order they complete). handle may raise FetchError
+        to reject a response. Returns (key, FetchError) for every item which
+        couldn't be fetched.
+        '''
+        return asyncio.run(self._fetch_all(items, handle))
+
+    def fetch(self, url):
+        '''Fetch a single url'''
+        bodies = {}
+        failures = self.fetch_all([(url, url)], bodies.__setitem__)
+        if failures:
+            raise FetchError('could not get {}'.format(url))
+        return bodies[url]
@@ -0,0 +1,133 @@
+# Format this file with python3 -m autopep8 -i json_project.py
+
+# Field projection for JSON documents: decode only the parts of a document
+# which are asked for, and step over everything else without building it.
+#
+# Fields are selected with a spec, a dict whose keys are object member names
+# (a trailing * matches any name with that prefix) and whose values are either
+# True, to decode the whole value, or another spec, to project the value (an
+# object) further. For example, to get the device IDs from a report:
+#
+#     {'properties': {'vendorID': True, 'deviceID': True, 'deviceName': True}}
+#
+# Skipped values are only scanned far enough to find where they end, so they
+# aren't fully validated; the structure of the document still is, and a
+# truncated document is still an error.
+
+import json
+import re
+import sys
+
+_decoder = json.JSONDecoder()
+_scanstring = json.decoder.scanstring
+_whitespace = re.compile(r'[ \t\n\r]*')
+_string = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Possessive repeats (Python 3.11+) save the regex engine from keeping
+# backtracking state it would never use.
+_MANY = '*+' if sys.version_info >= (3, 11) else '*'
+# Anything up to the next bracket which isn't in a string
+_PLAIN = r'[^"\[\]{{}}]{0}(?:"[^"\\]{0}(?:\\.[^"\\]{0}){0}"[^"\[\]{{}}]{0}){0}'.format(_MANY)
+_plain = re.compile(_PLAIN)
+
+
+def _nested(depth):
+    '''A regex matching an array or object nested at most depth deep'''
+    inner = _PLAIN
+    if depth > 1:
+        inner = '{0}(?:{1}{0}){2}'.format(_PLAIN, _nested(depth - 1), _MANY)
+    return r'[\[{]' + inner + r'[\]}]'
+
+
+# Most of a report is shallow enough to be skipped by a single match of this
+_container = re.compile(_nested(6))
+# A number, true, false or null
+_scalar = re.compile(r'[^,:\[\]{}\s]+')
+
+
+def _ws(text, pos):
+    return _whitespace.match(text, pos).end()
+
+
+def _skip(text, pos):
+    '''The end of the value starting at pos'''
+    c = text[pos]
+    if c == '"':
+        return _string.match(text, pos).end()
+    if c not in '[{':
+        return _scalar.match(text, pos).end()
+    depth = 0
+    while True:
+        pos = _plain.match(text, pos).end()
+        m = _container.match(text, pos)
+        if m:
+            pos = m.end()
+            if depth == 0:
+                return pos
+            continue
+        c = text[pos]
+        pos = pos + 1
+        if c in '[{':
+            depth = depth + 1
+        else:
+            depth = depth - 1
+            if depth == 0:
+                return pos
+
+
+def _select(spec, key):
+    if key in spec:
+        return spec[key]
+    for pattern, sub in spec.items():
+        if pattern.endswith('*') and key.startswith(pattern[:-1]):
+            return sub
+    return None
+
+
+def _project(text, pos, spec):
+    '''(the projection of the object at pos, the end of the object)'''
+    if text[pos] != '{':
+        raise ValueError('expected an object at position {}'.format(pos))
+    result = {}
+    pos = _ws(text, pos + 1)
+    if text[pos] == '}':
+        return result, pos + 1
+    while True:
+        if text[pos] != '"':
+            raise ValueError('expected a member name at position {}'.format(pos))
+        key, pos = _scanstring(text, pos + 1)
+        pos = _ws(text, pos)
+        if text[pos] != ':':
+            raise ValueError('expected : at position {}'.format(pos))
+        pos = _ws(text, pos + 1)
+
+        sub = _select(spec, key)
+        if sub is None:
+            pos = _skip(text, pos)
+        elif sub is True or text[pos] != '{':
+            result[key], pos = _decoder.raw_decode(text, pos)
+        else:
+            result[key], pos = _project(text, pos, sub)
+
+        pos = _ws(text, pos)
+        if text[pos] == '}':
+            return result, pos + 1
+        if text[pos] != ',':
+            raise ValueError('expected , or }} at position {}'.format(pos))
+        pos = _ws(text, pos + 1)
+
+
+def loads(text, spec):
+    '''Decode the fields of the JSON object in text selected by spec'''
+    try:
+        result, pos = _project(text, _ws(text, 0), spec)
+    except (IndexError, AttributeError):
+        # Ran off the end of the text, or a regex didn't match
+        raise ValueError('truncated or malformed JSON')
+    if _ws(text, pos) != len(text):
+        raise ValueError('extra data at position {}'.format(pos))
+    return result
+
+
+def load(f, spec):
+    '''Like loads(), but reading from a file'''
+    return loads(f.read(), spec)
@@ -0,0 +1,690 @@
+# Format this file with python3 -m autopep8 -i predicates.py
+
+# Declarative requirement predicates for query.py.
+#
+# A predicate can be called with a single report's info record, exactly like
+# the lambdas passed to add_rq(). It can also be compiled into a NumPy boolean
+# mask over every report in a report_store.ReportStore at once, which is how
+# run() evaluates requirements when NumPy is available. Plain lambdas still
+# work: they are evaluated report by report, and only for the reports which
+# passed every earlier requirement.
+
+import timing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def format_supported_with_optimal_tiling_features(formats_map, format, flags):
+    return format in formats_map and (int(formats_map[format]['optimalTilingFeatures']) & flags) == flags
+
+
+def format_supported_with_linear_tiling_features(formats_map, format, flags):
+    return format in formats_map and (int(formats_map[format]['linearTilingFeatures']) & flags) == flags
+
+
+def try_to_int(value):
+    if type(value) == str:
+        return int(value, 0)
+    else:
+        return value
+
+
+def _is_number(value):
+    return type(value) in (int, float)
+
+
+def _column_arrays(column, convert):
+    present = numpy.frombuffer(column.present, dtype=numpy.uint8) != 0
+    if column.typecode in ('q', 'Q', 'd'):
+        return numpy.frombuffer(column.values, dtype=column.typecode), present
+    values = []
+    for v, p in zip(column.values, column.present):
+        if p and convert:
+            try:
+                v = convert(v)
+            except (TypeError, ValueError, IndexError, KeyError):
+                return None
+        if p and not _is_number(v):
+            return None
+        values.append(v if p else 0)
+    try:
+        return numpy.array(values, dtype=numpy.int64 if all(type(v) == int for v in values) else None), present
+    except OverflowError:
+        return numpy.array(values, dtype=object), present
+
+
+class ReportArrays:
+    '''
+    NumPy views of the columns of a ReportStore, built the first time each one
+    is needed. Typed columns are wrapped without copying.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+        self._cache = {}
+
+    def _cached(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def values(self, table, name, convert=None):
+        '''
+        (values, present) arrays for one column of a ColumnTable. Values which
+        aren't plain numbers are passed through convert first; None if that
+        isn't enough to make every present value a number.
+        '''
+        return self._cached((id(table), name, convert),
+                            lambda: _column_arrays(table.column(name), convert))
+
+    def limit(self, name, index=None, convert=None):
+        if index is None:
+            return self.values(self.store.limits, name, convert)
+
+        def element(v):
+            v = v[index]
+            return convert(v) if convert else v
+        return self._cached(('limit', name, index, convert),
+                            lambda: _column_arrays(self.store.limits.column(name), element))
+
+    def header(self, name):
+        return self.values(self.store.header, name)
+
+    def names(self, nameset, name):
+        '''Boolean mask of the reports whose set contains name'''
+        def matrix():
+            # The bitsets stay packed, a byte per 8 names; only the byte
+            # holding each name's bit is looked at.
+            nbytes = (len(nameset.names) + 7) // 8 or 1
+            packed = b''.join(row.to_bytes(nbytes, 'little')
+                              for row in nameset.rows)
+            return numpy.frombuffer(packed, dtype=numpy.uint8).reshape(
+                len(nameset.rows), nbytes)
+        if name not in nameset.bits:
+            return numpy.zeros(len(self.store), dtype=bool)
+        bit = nameset.bits[name]
+        packed = self._cached((id(nameset), 'matrix'), matrix)
+        return (packed[:, bit >> 3] >> (bit & 7)) & 1 != 0
+
+    def format_matrix(self, name):
+        '''
+        One of the arrays of the format table (see report_store.FormatTable),
+        as a (VkFormat x format profile) matrix. If the table is memory-mapped
+        this is a view of the file, so each row is read only when it is used.
+        '''
+        table = self.store.formats
+
+        def build():
+            dtype = numpy.uint8 if name == 'present' else numpy.uint64
+            values = table.arrays[name]
+            if not len(values):
+                return numpy.zeros((len(table.formats), table.profiles), dtype=dtype)
+            values = numpy.frombuffer(values, dtype=dtype)
+            if table.format_major:
+                return values.reshape(len(table.formats), table.profiles)
+            return values.reshape(table.profiles, len(table.formats)).T
+        return self._cached(('format matrix', name), build)
+
+    def format_profiles(self):
+        table = self.store.formats
+        return self._cached('format profiles',
+                            lambda: numpy.frombuffer(table.profile, dtype=table.profile.typecode))
+
+    def format_flags(self, tiling, format):
+        '''(flags, present) per report for one VkFormat'''
+        table = self.store.formats
+        if format not in table.column:
+            zeros = numpy.zeros(len(self.store), dtype=numpy.uint64)
+            return zeros, zeros != 0
+
+        def build():
+            c = table.column[format]
+            profile = self.format_profiles()
+            return (self.format_matrix(tiling)[c][profile],
+                    self.format_matrix('present')[c][profile] != 0)
+        return self._cached(('format', tiling, format), build)
+
+    def formats_supported(self, tiling, formats, flags):
+        '''
+        Whether each report supports each formats[j] with all of flags[j], as
+        a (len(formats) x reports) boolean matrix. All of them are checked at
+        once, on the rows of the format matrix, before being spread out to the
+        reports.
+        '''
+        table = self.store.formats
+        known = numpy.array([fmt in table.column for fmt in formats], dtype=bool)
+        if not known.any():
+            return numpy.zeros((len(formats), len(self.store)), dtype=bool)
+        rows = numpy.array([table.column.get(fmt, 0) for fmt in formats], dtype=numpy.int64)
+        flags = numpy.array(flags, dtype=numpy.uint64)[:, None]
+        supported = (((self.format_matrix(tiling)[rows] & flags) == flags) &
+                     (self.format_matrix('present')[rows] != 0) & known[:, None])
+        return supported[:, self.format_profiles()]
+
+
+class Predicate:
+    '''
+    Base class for declarative requirements. Subclasses implement __call__
+    (one report) and mask (all reports, or None if it can't be vectorized).
+    '''
+    # Rough cost of calling it on one report, for cheap_first(): 1 for the
+    # header, features and extensions, 2 for limits and properties, 3 for
+    # formats and dates, 4 for anything else
+    cost = 2
+    # Whether it only depends on the capability profile of a report (see
+    # ReportStore.capability), so it can be evaluated once per profile
+    per_profile = True
+
+    def __call__(self, info):
+        raise NotImplementedError
+
+    def mask(self, arrays):
+        return None
+
+    def fingerprint(self):
+        '''
+        What the predicate tests (its class and parameters), for the result
+        cache (see result_cache.py), or None if that isn't known
+        '''
+        if not self.per_profile:
+            return None
+        params = []
+        for name, value in sorted(vars(self).items()):
+            if name == 'predicates':
+                value = [p.fingerprint() for p in value]
+                if None in value:
+                    return None
+            params.append((name, value))
+        return repr((type(self).__name__, params))
+
+    def __or__(self, other):
+        return AnyOf(self, other)
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+
+def _as_predicate(p):
+    return p if isinstance(p, Predicate) else Lambda(p)
+
+
+class Lambda(Predicate):
+    '''
+    An arbitrary function of info; always evaluated report by report. It may
+    look at anything, like info.report or info.date, so it is called for
+    every report unless per_profile says it only looks at what the capability
+    profile covers (limits, properties, features, extensions, formats, the
+    header and the environment other than its submitter and comment).
+    '''
+    cost = 4
+
+    def __init__(self, passes, per_profile=False):
+        self.passes = passes
+        self.per_profile = per_profile
+
+    def __call__(self, info):
+        return self.passes(info)
+
+    def fingerprint(self):
+        return None
+
+
+class AnyOf(Predicate):
+    def __init__(self, *predicates):
+        self.predicates = [_as_predicate(p) for p in predicates]
+
+    @property
+    def cost(self):
+        return max(p.cost for p in self.predicates)
+
+    @property
+    def per_profile(self):
+        return all(p.per_profile for p in self.predicates)
+
+    def __call__(self, info):
+        return any(p(info) for p in self.predicates)
+
+    def mask(self, arrays):
+        masks = [p.mask(arrays) for p in self.predicates]
+        if any(m is None for m in masks):
+            return None
+        return numpy.logical_or.reduce(masks)
+
+
+class AllOf(Predicate):
+    def __init__(self, *predicates):
+        self.predicates = [_as_predicate(p) for p in predicates]
+
+    @property
+    def cost(self):
+        return max(p.cost for p in self.predicates)
+
+    @property
+    def per_profile(self):
+        return all(p.per_profile for p in self.predicates)
+
+    def __call__(self, info):
+        return all(p(info) for p in self.predicates)
+
+    def mask(self, arrays):
+        masks = [p.mask(arrays) for p in self.predicates]
+        if any(m is None for m in masks):
+            return None
+        return numpy.logical_and.reduce(masks)
+
+
+class LimitComparison(Predicate):
+    '''
+    Compare a limit (or one element of a vector limit) against a value. If the
+    value is a list, every element of the limit is compared.
+    '''
+    convert = None
+
+    def __init__(self, name, value, index=None):
+        self.name = name
+        self.value = value
+        self.index = index
+
+    def _elements(self):
+        if type(self.value) == list:
+            return list(enumerate(self.value))
+        return [(self.index, self.value)]
+
+    def _limit(self, info, index):
+        v = info.limits[self.name]
+        if index is not None:
+            v = v[index]
+        return self.convert(v) if self.convert else v
+
+    def __call__(self, info):
+        return all(self.compare(self._limit(info, index), value)
+                   for index, value in self._elements())
+
+    def mask(self, arrays):
+        result = None
+        for index, value in self._elements():
+            column = arrays.limit(self.name, index, self.convert)
+            if column is None:
+                return None
+            values, present = column
+            m = present & self.compare(values, value)
+            result = m if result is None else result & m
+        return result
+
+
+class MinLimit(LimitComparison):
+    '''info.limits[name] >= value'''
+
+    def compare(self, limit, value):
+        return limit >= value
+
+
+class MaxLimit(LimitComparison):
+    '''info.limits[name] <= value, where the limit may be a numeric string'''
+    convert = staticmethod(try_to_int)
+
+    def compare(self, limit, value):
+        return limit <= value
+
+
+class LimitEquals(LimitComparison):
+    '''info.limits[name] == value'''
+
+    def compare(self, limit, value):
+        return limit == value
+
+
+class BitsLimit(Predicate):
+    '''info.limits[name] has all of the given bits set'''
+
+    def __init__(self, name, bits):
+        self.name = name
+        self.bits = bits
+
+    def __call__(self, info):
+        return (info.limits[self.name] & self.bits) == self.bits
+
+    def mask(self, arrays):
+        column = arrays.limit(self.name)
+        if column is None or column[0].dtype.kind not in 'iu':
+            return None
+        values, present = column
+        return present & ((values & self.bits) == self.bits)
+
+
+class MinOptProperty(Predicate):
+    '''The property is absent, or is at least value'''
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __call__(self, info):
+        return (self.name not in info.properties) or int(info.properties[self.name]) >= self.value
+
+    def mask(self, arrays):
+        column = arrays.values(arrays.store.properties, self.name, int)
+        if column is None:
+            return None
+        values, present = column
+        if values.dtype.kind == 'f':
+            values = numpy.trunc(values)
+        return ~present | (values >= self.value)
+
+
+class Feature(Predicate):
+    '''The feature is supported, by the core, core1x or extended features'''
+    cost = 1
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, info):
+        return self.name in info.features
+
+    def mask(self, arrays):
+        return arrays.names(arrays.store.features, self.name)
+
+
+class Extension(Predicate):
+    cost = 1
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, info):
+        return self.name in info.extensions
+
+    def mask(self, arrays):
+        return arrays.names(arrays.store.extensions, self.name)
+
+
+class ApiVariant(Predicate):
+    cost = 1
+
+    def __init__(self, variant):
+        self.variant = variant
+
+    def __call__(self, info):
+        return info.apiVariant == self.variant
+
+    def mask(self, arrays):
+        values, present = arrays.header('apiVersion')
+        return present & ((values >> 29) == self.variant)
+
+
+class ApiMajorVersion(Predicate):
+    cost = 1
+
+    def __init__(self, major):
+        self.major = major
+
+    def __call__(self, info):
+        return info.apiVersion[0] == self.major
+
+    def mask(self, arrays):
+        values, present = arrays.header('apiVersion')
+        return present & (((values >> 22) & 0b1111111) == self.major)
+
+
+class MinApiVersion(Predicate):
+    '''info.apiVersion >= version, as a (major, minor, patch) tuple'''
+    cost = 1
+
+    def __init__(self, version):
+        self.version = tuple(version)
+
+    def __call__(self, info):
+        return info.apiVersion >= self.version
+
+    def mask(self, arrays):
+        values, present = arrays.header('apiVersion')
+        # Comparing the packed versions (without the variant) is the same as
+        # comparing the tuples.
+        major, minor, patch = self.version
+        packed = values & ((1 << 29) - 1)
+        return present & (packed >= (major << 22) | (minor << 12) | patch)
+
+
+class VendorID(Predicate):
+    '''The report's vendorID is one of the given ones'''
+    cost = 1
+
+    def __init__(self, vendorIDs):
+        self.vendorIDs = list(vendorIDs)
+
+    def __call__(self, info):
+        return info.header['vendorID'] in self.vendorIDs
+
+    def mask(self, arrays):
+        column = arrays.header('vendorID')
+        if column is None:
+            return None
+        values, present = column
+        return present & numpy.isin(values, self.vendorIDs)
+
+
+class FormatFeatures(Predicate):
+    '''The format supports all of the given features with the given tiling'''
+    cost = 3
+
+    def __init__(self, format, flags, tiling='optimal'):
+        self.format = format
+        self.flags = flags
+        self.tiling = tiling
+
+    def __call__(self, info):
+        if self.tiling == 'linear':
+            return format_supported_with_linear_tiling_features(info.fmts, self.format, self.flags)
+        return format_supported_with_optimal_tiling_features(info.fmts, self.format, self.flags)
+
+    def mask(self, arrays):
+        flags, present = arrays.format_flags(self.tiling, self.format)
+        return present & ((flags & self.flags) == self.flags)
+
+
+class SubmittedSince(Predicate):
+    '''
+    The report was submitted on or after date (a datetime.date), going by the
+    dates saved by fetch-new-data.py, or estimated from the report id. If no
+    dates are known at all, every report fails it; query.py refuses to run it
+    then.
+    '''
+    cost = 3
+    per_profile = False
+
+    def __init__(self, date):
+        self.date = date
+
+    def __call__(self, info):
+        return info.date is not None and info.date >= self.date
+
+    def mask(self, arrays):
+        dates = arrays.store.estimated_dates()
+        if dates is None:
+            return numpy.zeros(len(arrays.store), dtype=bool)
+        return numpy.array(dates, dtype=numpy.int64) >= self.date.toordinal()
+
+
+def cheap_first(requirements):
+    '''
+    The requirements, stably reordered so that the cheapest ones are
+    evaluated first. Reports are then blamed on the cheapest requirement they
+    fail, rather than on the first one listed.
+    '''
+    return sorted(requirements, key=lambda rq: _as_predicate(rq.passes).cost)
+
+
+def report_arrays(store):
+    '''The ReportArrays of a store, kept with it so they're only built once'''
+    if getattr(store, '_arrays', None) is None:
+        store._arrays = ReportArrays(store)
+    return store._arrays
+
+
+def first_failures(store, requirements, cache=None):
+    '''
+    For every report in the store, the index of the first requirement it fails
+    (len(requirements) if it passes them all), plus a dict of any info records
+    which had to be built along the way, by report index.
+
+    Requirements which can't be evaluated as masks, but only depend on the
+    capability profile (see Predicate.per_profile), are only called once per
+    profile (see ReportStore.capability), with the first report which has
+    that profile, and the result is shared by every report with it. If there
+    is a cache (a result_cache.ResultCache), those requirements are only
+    evaluated for the profiles it hasn't seen them evaluated for. Others, like
+    lambdas, are called for each report.
+    '''
+    infos = {}
+    first = store.capability_reports()
+
+    def info(i):
+        if i not in infos:
+            infos[i] = store.info(i)
+        return infos[i]
+
+    # The plain rq.passes unless profiling
+    passes = [timing.timed(rq.passes, rq.name, 'requirements')
+              for rq in requirements]
+    arrays = report_arrays(store) if numpy is not None else None
+
+    def mask(k):
+        if arrays is None or not isinstance(requirements[k].passes, Predicate):
+            return None
+        return timing.timed(requirements[k].passes.mask, requirements[k].name, 'requirements')(arrays)
+
+    def cached(k):
+        '''Whether each profile passes requirement k, if it can be cached'''
+        if cache is None:
+            return None
+
+        def evaluate(profiles):
+            return [bool(passes[k](info(first[c]))) for c in profiles]
+        return cache.passes(requirements[k].passes, evaluate)
+
+    if numpy is None:
+        profile_passes = [cached(k) for k in range(len(requirements))]
+        # Requirements which depend on more than the profile are checked for
+        # each report afterwards.
+        per_report = [k for k, rq in enumerate(requirements)
+                      if not _as_predicate(rq.passes).per_profile]
+        per_profile = [k for k in range(len(requirements)) if k not in per_report]
+        profile_failed_at = []
+        for c, i in enumerate(first):
+            for k in per_profile:
+                if profile_passes[k] is not None:
+                    if not profile_passes[k][c]:
+                        break
+                elif not passes[k](info(i)):
+                    break
+            else:
+                k = len(requirements)
+            profile_failed_at.append(k)
+            infos.pop(i, None)
+        failed_at = [profile_failed_at[c] for c in store.capability]
+        for i in range(len(store)):
+            for k in per_report:
+                if k >= failed_at[i]:
+                    break
+                if not passes[k](info(i)):
+                    failed_at[i] = k
+                    break
+        return failed_at, infos
+
+    capability = numpy.frombuffer(store.capability, dtype=store.capability.typecode)
+    alive = numpy.ones(len(store), dtype=bool)
+    failed_at = numpy.full(len(store), len(requirements))
+    for k, rq in enumerate(requirements):
+        m = mask(k)
+        if m is None:
+            profile_passes = cached(k)
+            if profile_passes is not None:
+                m = numpy.asarray(profile_passes, dtype=bool)[capability]
+        if m is None and _as_predicate(rq.passes).per_profile:
+            profile_passes = numpy.zeros(len(first), dtype=bool)
+            for c in numpy.unique(capability[alive]).tolist():
+                profile_passes[c] = bool(passes[k](info(first[c])))
+            m = profile_passes[capability]
+        elif m is None:
+            m = numpy.zeros(len(store), dtype=bool)
+            for i in numpy.flatnonzero(alive).tolist():
+                m[i] = bool(passes[k](info(i)))
+        failed = alive & ~m
+        failed_at[failed] = k
+        alive &= m
+        if infos:
+            for i in numpy.flatnonzero(failed).tolist():
+                infos.pop(i, None)
+    return failed_at.tolist(), infos
+
+
+def _bits(passes):
+    '''A bitset (int) with bit i set if passes[i]'''
+    if numpy is not None:
+        return int.from_bytes(numpy.packbits(numpy.asarray(passes, dtype=bool), bitorder='little').tobytes(), 'little')
+    packed = bytearray((len(passes) + 7) // 8)
+    for i, p in enumerate(passes):
+        if p:
+            packed[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(packed, 'little')
+
+
+def pass_bits(store, requirements, cache=None, infos=None):
+    '''
+    For each requirement, a bitset (int) of the reports which pass it. Unlike
+    first_failures(), every requirement is evaluated for every report; those
+    which can't be evaluated as masks are called once per capability profile,
+    or looked up in the cache if there is one. Plain FormatFeatures
+    requirements are evaluated together, one tiling at a time (see
+    ReportArrays.formats_supported()). infos are info records already built
+    (e.g. by first_failures()), by report index, which are used rather than
+    built again, along with whatever they have already read.
+    '''
+    first = store.capability_reports()
+    if infos is None:
+        infos = {}
+    arrays = report_arrays(store) if numpy is not None else None
+    masks = {}
+    if arrays is not None:
+        for tiling in ('optimal', 'linear'):
+            ks = [k for k, rq in enumerate(requirements)
+                  if isinstance(rq.passes, FormatFeatures) and rq.passes.tiling == tiling]
+            if ks:
+                supported = arrays.formats_supported(
+                    tiling, [requirements[k].passes.format for k in ks],
+                    [requirements[k].passes.flags for k in ks])
+                masks.update(zip(ks, supported))
+
+    def info(i):
+        if i not in infos:
+            infos[i] = store.info(i)
+        return infos[i]
+
+    def evaluate(rq, profiles):
+        return [bool(rq.passes(info(first[c]))) for c in profiles]
+
+    result = []
+    for k, rq in enumerate(requirements):
+        m = masks.get(k)
+        if m is None and arrays is not None and isinstance(rq.passes, Predicate):
+            m = rq.passes.mask(arrays)
+        profile_passes = None
+        if m is None and cache is not None:
+            profile_passes = cache.passes(
+                rq.passes, lambda profiles: evaluate(rq, profiles))
+        if m is None and profile_passes is None:
+            if _as_predicate(rq.passes).per_profile:
+                profile_passes = evaluate(rq, list(range(len(first))))
+            else:
+                m = [bool(rq.passes(info(i))) for i in range(len(store))]
+        if m is None and arrays is not None:
+            capability = numpy.frombuffer(store.capability, dtype=store.capability.typecode)
+            m = numpy.array(profile_passes, dtype=bool)[capability]
+        elif m is None:
+            m = [profile_passes[c] for c in store.capability]
+        result.append(_bits(m))
+    return result
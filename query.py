@@ -2,12 +2,28 @@
 # Format this file with python3 -m autopep8 -i query.py
 
 from collections import defaultdict, namedtuple, OrderedDict
-import glob
+import bisect
+import csv
+import datetime
+import getopt
 import json
 import time
 import re
 import sys
-import xml.etree.ElementTree as ET
+
+# Every predicate is imported, along with the format helpers query.py used to
+# define, so that requirements (and lambdas) added below can use them.
+from predicates import (AllOf, AnyOf, ApiMajorVersion, ApiVariant, BitsLimit, Extension, Feature,
+                        FormatFeatures, Lambda, LimitComparison, LimitEquals, MaxLimit,
+                        MinApiVersion, MinLimit, MinOptProperty, Predicate, SubmittedSince,
+                        VendorID, cheap_first, first_failures,
+                        format_supported_with_linear_tiling_features,
+                        format_supported_with_optimal_tiling_features, pass_bits, try_to_int)
+import report_store
+import requirement_files
+import result_cache
+import timing
+import vk_enums
 
 
 class dotdict(dict):
@@ -17,240 +33,732 @@ class dotdict(dict):
     __delattr__ = dict.__delitem__
 
 
-def load_vk_enums():
-    '''Load useful enums from vk.xml'''
-    tree = ET.parse('third_party/vulkan/vk.xml')
-    root = tree.getroot()
-    vk = dotdict()
-    vk.Format = dotdict()
-    for e in root.findall("./enums[@name='VkFormat']/*"):
-        name = e.attrib['name'][len('VK_FORMAT_'):]
-        vk.Format[name] = int(e.attrib['value'])
-    vk.FormatFeature = dotdict()
-    for e in root.findall("./enums[@name='VkFormatFeatureFlagBits']/*"):
-        name = e.attrib['name'][len('VK_FORMAT_FEATURE_'):-len('_BIT')]
-        vk.FormatFeature[name] = 1 << int(e.attrib['bitpos'])
-    vk.SampleCount = dotdict()
-    for e in root.findall("./enums[@name='VkSampleCountFlagBits']/*"):
-        # keep the leading underscore
-        name = e.attrib['name'][len('VK_SAMPLE_COUNT'):-len('_BIT')]
-        vk.SampleCount[name] = 1 << int(e.attrib['bitpos'])
-    return vk
-
-
 Rq = namedtuple('Rq', ['name', 'passes', 'passed_reports', 'failed_reports'])
 Group = namedtuple('Group', ['name', 'sort'])
 
 
-def run(requirements, groups=[]):
-    def extractFormatsMap(report):
-        m = dotdict()
-        for fmt in report['formats']:
-            m[fmt[0]] = fmt[1]
-        return m
-
+def short_deviceName(deviceName):
+    # +  ' ' + report['properties']['driverVersionText']
+    return re.sub(r' \((LLVM|ACO|Subzero).*?\)', '', deviceName)
+
+
+# Columns of --output csv. Each kind of record uses some of them; see evaluate().
+OUTPUT_FIELDS = ['scenario', 'type', 'requirement', 'deviceName', 'loses', 'failed_reports',
+                 'passed_reports', 'fails', 'fails_deviceNames', 'only_fails', 'kept_deviceNames',
+                 'rank', 'further_lost', 'remaining', 'supported', 'total', 'status', 'group',
+                 'bucket', 'count', 'from', 'to']
+
+
+class ResultWriter:
+    '''
+    Streams machine-readable result records to result-<timestamp>.jsonl or
+    .csv as they are produced, alongside the text result.
+    '''
+
+    def __init__(self, output_format, timestamp):
+        self.filename = 'result-{}.{}'.format(timestamp, output_format)
+        self.f = open(self.filename, 'w', newline='')
+        self.csv = None
+        if output_format == 'csv':
+            self.csv = csv.DictWriter(self.f, OUTPUT_FIELDS)
+            self.csv.writeheader()
+        # Added to every record by run_scenarios()
+        self.scenario = None
+
+    def write(self, record):
+        if self.scenario is not None:
+            record = dict(scenario=self.scenario, **record)
+        if self.csv:
+            self.csv.writerow({k: ' '.join(map(str, v)) if type(v) == list else v
+                               for k, v in record.items()})
+        else:
+            self.f.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self.f.close()
+        print('Records saved to {}'.format(self.filename))
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+def analyze(store, requirements, emit, cache=None, infos=None):
+    '''
+    How much each requirement loses regardless of the order they are listed
+    in, from a bitset per requirement of the reports which pass it:
+    every report failing it, reports failing nothing else, and deviceNames
+    which would keep a supported report if it alone were dropped. Also a
+    greedy order of the requirements, each losing the most further reports.
+    This evaluates every requirement for every report, so it is only done
+    with --analyze. infos are the info records left by first_failures().
+    '''
+    n = len(store)
+    full = (1 << n) - 1
+    passes = pass_bits(store, requirements, cache, infos)
+
+    indices_by_deviceName = defaultdict(list)
+    for i, deviceName in enumerate(store.deviceNames):
+        indices_by_deviceName[short_deviceName(deviceName)].append(i)
+    deviceName_bits = []
+    for indices in indices_by_deviceName.values():
+        packed = bytearray((n + 7) // 8)
+        for i in indices:
+            packed[i >> 3] |= 1 << (i & 7)
+        deviceName_bits.append(int.from_bytes(packed, 'little'))
+
+    def deviceNames_with(bits):
+        return sum(1 for d in deviceName_bits if d & bits)
+
+    # ANDs of the requirements before and after each one, so that "all but
+    # this one" is a single AND
+    before = [full]
+    for bits in passes:
+        before.append(before[-1] & bits)
+    after = [full] * (len(passes) + 1)
+    for r in reversed(range(len(passes))):
+        after[r] = after[r + 1] & passes[r]
+    supported = deviceNames_with(before[-1])
+
+    header = ['fails', 'fails (deviceNames)', 'only fails this',
+              'kept without it (deviceNames)', 'requirement']
+    rows = []
+    for r, rq in enumerate(requirements):
+        fails = full & ~passes[r]
+        others = before[r] & after[r + 1]
+        rows.append([popcount(fails), deviceNames_with(fails), popcount(others & fails),
+                     deviceNames_with(others) - supported, rq.name])
+        emit({'type': 'analysis', 'requirement': rq.name, 'fails': rows[-1][0],
+              'fails_deviceNames': rows[-1][1], 'only_fails': rows[-1][2],
+              'kept_deviceNames': rows[-1][3]})
+
+    result = 'Every requirement for every one of {} reports ({} deviceNames):\n'.format(
+        n, len(deviceName_bits))
+    widths = [max(len(str(row[c])) for row in [header] + rows)
+              for c in range(len(header) - 1)]
+    for row in [header] + rows:
+        result += '  ' + '  '.join(str(v).rjust(w)
+                                   for v, w in zip(row, widths)) + '  ' + row[-1] + '\n'
+
+    result += '\nGreedy order (each requirement loses the most further reports):\n'
+    alive = full
+    remaining = list(range(len(requirements)))
+    while remaining:
+        r = max(remaining, key=lambda r: popcount(alive & ~passes[r]))
+        lost = popcount(alive & ~passes[r])
+        if not lost:
+            result += '  The other {} requirements lose no further reports.\n'.format(
+                len(remaining))
+            break
+        alive &= passes[r]
+        remaining.remove(r)
+        result += '  {}: loses {} further reports, leaving {}\n'.format(
+            requirements[r].name, lost, popcount(alive))
+        emit({'type': 'greedy', 'rank': len(requirements) - len(remaining),
+              'requirement': requirements[r].name, 'further_lost': lost,
+              'remaining': popcount(alive)})
+    return result + '\n'
+
+
+def evaluate(store, requirements, groups=[], output=None, cache=None, analysis=False):
+    '''
+    Apply the requirements to every report in the store. Returns the result
+    text, and the supported and unsupported report ids by deviceName. Records
+    are written to output (a ResultWriter) as the text is built. Results are
+    looked up in and added to cache (a result_cache.ResultCache), if any.
+    With analysis, the order-independent analysis (see analyze()) follows.
+    '''
+    emit = output.write if output else lambda record: None
     deviceName_values = set()
     ids_by_deviceName = defaultdict(
         lambda: dotdict({'supported': [], 'unsupported': []}))
-    reports_filenames = glob.glob('data/reports/*.json')
-    reports_entries = sorted(map(lambda f: (
-        int(f[len('data/reports/'):-len('.json')]), f), reports_filenames))
+    for rq in requirements:
+        rq.passed_reports.clear()
+        rq.failed_reports.clear()
 
     total_supported = 0
     device_groups = defaultdict(lambda: defaultdict(lambda: 0))
+    # The same, for each deviceName
+    deviceName_groups = defaultdict(lambda: defaultdict(lambda: 0))
 
-    for report_id, filename in reports_entries:
-        report = None
-        with open(filename) as f:
-            try:
-                report = json.load(f)
-            except KeyboardInterrupt:
-                sys.exit(1)
-            except:
-                print('error parsing {}'.format(filename))
-                continue
-
-        apiVersion = report['properties']['apiVersion']
-
-        info = dotdict()
-        info.report = report
-        info.apiVariant = apiVersion >> 29
-        info.apiVersion = (
-            (apiVersion >> 22) & 0b1111111,
-            (apiVersion >> 12) & 0b1111111111,
-            apiVersion & 0b111111111111,
-        )
-        info.fmts = extractFormatsMap(report)
-        info.features = set([k for (k, v) in report['features'].items() if v])
-        info.extensions = set(e['extensionName'] for e in report['extensions'])
-        for core1x in report:
-            if core1x.startswith('core1') and 'features' in report[core1x]:
-                for k, v in report[core1x]['features'].items():
-                    if v:
-                        info.features.add(k)
-        if 'extended' in report and 'devicefeatures2' in report['extended']:
-            for v in report['extended']['devicefeatures2']:
-                if v['supported']:
-                    info.features.add(v['name'])
-        info.limits = report['properties']['limits']
-
-        info.properties = {}
-        for core1x in report:
-            if core1x.startswith('core1') and 'properties' in report[core1x]:
-                for k, v in report[core1x]['properties'].items():
-                    info.properties[k] = v
-        if 'extended' in report and 'deviceproperties2' in report['extended']:
-            for v in report['extended']['deviceproperties2']:
-                # These entries tell us which extension they come from, too,
-                # but we just ignore that for now since we don't need it.
-                info.properties[v['name']] = v['value']
-
-        # Normalize properties to numbers where possible
-        for k, v in info.properties.items():
-            if v == 'true':
-                v = 1
-            elif v == 'false':
-                v = 0
-            elif type(v) == str:
-                try:
-                    v = int(v)
-                except ValueError:
-                    try:
-                        v = float(v)
-                    except ValueError:
-                        pass
-            info.properties[k] = v
-
-        # +  ' ' + report['properties']['driverVersionText']
-        deviceName = report['properties']['deviceName']
-        deviceName = re.sub(r' \((LLVM|ACO|Subzero).*?\)', '', deviceName)
-        deviceName_values.add(deviceName)
-
-        unsupported_because = None
-        for rq in requirements:
-            if rq.passes(info):
+    # Requirements are evaluated for all reports at once where possible; see
+    # predicates.py.
+    with timing.stage('evaluate'):
+        failed_at, infos = first_failures(store, requirements, cache)
+
+    with timing.stage('tally'):
+        for i, report_id in enumerate(store.ids):
+            deviceName = short_deviceName(store.deviceNames[i])
+            deviceName_values.add(deviceName)
+
+            unsupported_because = None
+            for rq in requirements[:failed_at[i]]:
                 rq.passed_reports[deviceName].append(report_id)
-            else:
+            if failed_at[i] < len(requirements):
+                rq = requirements[failed_at[i]]
                 rq.failed_reports[deviceName].append(report_id)
                 unsupported_because = rq.name
-                break
 
-        if unsupported_because:
-            ids_by_deviceName[deviceName].unsupported.append(report_id)
-        else:
-            ids_by_deviceName[deviceName].supported.append(report_id)
-            total_supported += 1
-            for group in groups:
-                bucket = group.sort(info)
-                device_groups[group.name][bucket] += 1
-
-        # if unsupported_because:
-        #    print('{}: "{}" failed "{}"'.format(
-        #        report_id, deviceName, unsupported_because))
-
-    result = 'Beginning with {} unique deviceNames in {} reports.\n\n'.format(
-        len(deviceName_values), len(reports_filenames))
-    for rq in requirements:
-        failed_reports_sorted = OrderedDict(sorted(rq.failed_reports.items()))
-
-        result_list_all = []
-        result_list_some = []
-        if len(failed_reports_sorted):
-            for name, ids in failed_reports_sorted.items():
-                passed_reports = rq.passed_reports[name]
-                if len(passed_reports) == 0:
-                    result_list_all.append('    x {}: {} of {}\n'.format(
-                        name, len(ids), len(ids)))
-
-            for name, ids in failed_reports_sorted.items():
-                passed_reports = rq.passed_reports[name]
-                if len(passed_reports) != 0:
-                    result_list_some.append('    ~ {}: {} of {} ({})\n'.format(
-                        name, len(ids), len(ids) + len(passed_reports),
-                        ' '.join(map(str, ids))))
-
-            result += 'Requirement "{}" loses {} (and partially loses {}) further deviceNames:\n'.format(
-                rq.name, len(result_list_all), len(result_list_some))
-            result += '  In ALL reports ({} deviceNames):\n{}'.format(
-                len(result_list_all), ''.join(result_list_all))
-            result += '  In SOME reports ({} deviceNames):\n{}'.format(
-                len(result_list_some), ''.join(result_list_some))
-            result += '\n'
-        else:
-            result += 'Requirement "{}" loses no further reports!\n\n'.format(
-                rq.name)
-
-    result_over90 = ''
-    result_under90 = ''
-    for deviceName, ids in sorted(ids_by_deviceName.items()):
-        supported = len(ids.supported)
-        total = supported + len(ids.unsupported)
-        if supported / total >= 0.9:
-            result_over90 += '  + {} ({} of {})\n'.format(deviceName,
-                                                          supported, total)
-        elif supported:
-            result_under90 += '  ? {} ({} of {})\n'.format(deviceName,
-                                                           supported, total)
-
-    result += 'At least 90% of each of the following was still supported:\n' + result_over90
-    result += 'At least one, but under 90% of each of the following was still supported:\n' + result_under90
-
-    if len(device_groups):
-        result += '\n\nGroupings of {} supported devices\n'.format(
-            total_supported)
-        for group_name, buckets in sorted(device_groups.items()):
-            result += '\n\n{}\n=====================\n'.format(group_name)
-            for bucket_name, count in sorted(buckets.items()):
-                result += '{}: {} ({}%)\n'.format(bucket_name,
-                                                  count, round(count / total_supported * 100, 1))
+            if unsupported_because:
+                ids_by_deviceName[deviceName].unsupported.append(report_id)
+            else:
+                ids_by_deviceName[deviceName].supported.append(report_id)
+                total_supported += 1
+                if groups:
+                    info = infos.get(i) or store.info(i)
+                for group in groups:
+                    bucket = group.sort(info)
+                    device_groups[group.name][bucket] += 1
+                    deviceName_groups[deviceName][group.name, bucket] += 1
+
+            # if unsupported_because:
+            #    print('{}: "{}" failed "{}"'.format(
+            #        report_id, deviceName, unsupported_because))
+
+    with timing.stage('format'):
+        result = 'Beginning with {} unique deviceNames in {} reports ({} distinct capability profiles).\n\n'.format(
+            len(deviceName_values), store.file_count, len(store.fingerprints))
+        for rq in requirements:
+            failed_reports_sorted = OrderedDict(sorted(rq.failed_reports.items()))
+
+            result_list_all = []
+            result_list_some = []
+            if len(failed_reports_sorted):
+                for name, ids in failed_reports_sorted.items():
+                    passed_reports = rq.passed_reports[name]
+                    if len(passed_reports) == 0:
+                        result_list_all.append('    x {}: {} of {}\n'.format(
+                            name, len(ids), len(ids)))
+                        emit({'type': 'requirement', 'requirement': rq.name, 'deviceName': name,
+                              'loses': 'all', 'failed_reports': ids, 'passed_reports': []})
+
+                for name, ids in failed_reports_sorted.items():
+                    passed_reports = rq.passed_reports[name]
+                    if len(passed_reports) != 0:
+                        result_list_some.append('    ~ {}: {} of {} ({})\n'.format(
+                            name, len(ids), len(ids) + len(passed_reports),
+                            ' '.join(map(str, ids))))
+                        emit({'type': 'requirement', 'requirement': rq.name, 'deviceName': name,
+                              'loses': 'some', 'failed_reports': ids, 'passed_reports': passed_reports})
+
+                result += 'Requirement "{}" loses {} (and partially loses {}) further deviceNames:\n'.format(
+                    rq.name, len(result_list_all), len(result_list_some))
+                result += '  In ALL reports ({} deviceNames):\n{}'.format(
+                    len(result_list_all), ''.join(result_list_all))
+                result += '  In SOME reports ({} deviceNames):\n{}'.format(
+                    len(result_list_some), ''.join(result_list_some))
+                result += '\n'
+            else:
+                result += 'Requirement "{}" loses no further reports!\n\n'.format(
+                    rq.name)
+
+    if analysis:
+        with timing.stage('analysis'):
+            result += analyze(store, requirements, emit, cache, infos)
+
+    with timing.stage('format'):
+        result_over90 = ''
+        result_under90 = ''
+        for deviceName, ids in sorted(ids_by_deviceName.items()):
+            supported = len(ids.supported)
+            total = supported + len(ids.unsupported)
+            emit({'type': 'deviceName', 'deviceName': deviceName, 'supported': supported,
+                  'total': total, 'status': support_status(ids)})
+            for (group_name, bucket_name), count in sorted(deviceName_groups[deviceName].items()):
+                emit({'type': 'deviceName_group', 'deviceName': deviceName, 'group': group_name,
+                      'bucket': bucket_name, 'count': count})
+            if supported / total >= 0.9:
+                result_over90 += '  + {} ({} of {})\n'.format(deviceName,
+                                                              supported, total)
+            elif supported:
+                result_under90 += '  ? {} ({} of {})\n'.format(deviceName,
+                                                               supported, total)
+
+        result += 'At least 90% of each of the following was still supported:\n' + result_over90
+        result += 'At least one, but under 90% of each of the following was still supported:\n' + result_under90
+
+        if len(device_groups):
+            result += '\n\nGroupings of {} supported devices\n'.format(
+                total_supported)
+            for group_name, buckets in sorted(device_groups.items()):
+                result += '\n\n{}\n=====================\n'.format(group_name)
+                for bucket_name, count in sorted(buckets.items()):
+                    result += '{}: {} ({}%)\n'.format(bucket_name,
+                                                      count, round(count / total_supported * 100, 1))
+                    emit({'type': 'group', 'group': group_name, 'bucket': bucket_name,
+                          'count': count})
+
+    return result, ids_by_deviceName
+
+
+def run(requirements, groups=[], jobs=1, output_format=None, cache=True, analysis=False):
+    '''
+    Print and save the result of the requirements. With output_format 'jsonl'
+    or 'csv', the same results are also saved as records in that format.
+    '''
+    store = report_store.load(jobs=jobs)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    output = ResultWriter(output_format, timestamp) if output_format else None
+    results = result_cache.ResultCache(store) if cache else None
+    result, _ = evaluate(store, requirements, groups, output, results, analysis)
+    print(result)
 
+    with timing.stage('write'):
+        if results:
+            results.save()
+        result_filename = 'result-{}.txt'.format(timestamp)
+        print('Result saved to {}'.format(result_filename))
+        with open(result_filename, 'w') as f:
+            f.write(result)
+        if output:
+            output.close()
+    return result
+
+
+def support_status(ids):
+    '''+ if at least 90% of a deviceName's reports are supported, ? if some, x if none'''
+    supported = len(ids.supported)
+    total = supported + len(ids.unsupported)
+    if supported / total >= 0.9:
+        return '+'
+    return '?' if supported else 'x'
+
+
+def run_scenarios(scenarios, groups=[], jobs=1, output_format=None, cache=True, analysis=False):
+    '''
+    Evaluate several named lists of requirements (e.g. tiers) against one
+    load of the reports. The result has the usual report for each scenario,
+    followed by the deviceNames whose support changes from each scenario to
+    the next.
+    '''
+    store = report_store.load(jobs=jobs)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    output = ResultWriter(output_format, timestamp) if output_format else None
+    results = result_cache.ResultCache(store) if cache else None
+    result = ''
+    ids_by_scenario = OrderedDict()
+    for name, requirements in scenarios.items():
+        if output:
+            output.scenario = name
+        scenario_result, ids_by_scenario[name] = evaluate(
+            store, requirements, groups, output, results, analysis)
+        result += 'Scenario "{}"\n=====================\n\n{}\n\n'.format(
+            name, scenario_result)
+
+    result += 'Changes between scenarios (+ at least 90% supported, ? some, x none)\n=====================\n'
+    if output:
+        output.scenario = None
+    names = list(ids_by_scenario)
+    for a, b in zip(names, names[1:]):
+        changes = []
+        for deviceName in sorted(ids_by_scenario[a]):
+            ids_a = ids_by_scenario[a][deviceName]
+            ids_b = ids_by_scenario[b][deviceName]
+            status_a = support_status(ids_a)
+            status_b = support_status(ids_b)
+            if status_a != status_b:
+                changes.append('  {} -> {} {} ({} -> {} of {})\n'.format(
+                    status_a, status_b, deviceName, len(ids_a.supported), len(ids_b.supported),
+                    len(ids_a.supported) + len(ids_a.unsupported)))
+                if output:
+                    output.write({'type': 'change', 'from': a, 'to': b, 'deviceName': deviceName,
+                                  'status': status_a + status_b})
+        result += '\n"{}" -> "{}": {} deviceNames change\n{}'.format(
+            a, b, len(changes), ''.join(changes))
     print(result)
 
-    result_filename = 'result-{}.txt'.format(time.strftime("%Y%m%d-%H%M%S"))
+    result_filename = 'result-{}.txt'.format(timestamp)
     print('Result saved to {}'.format(result_filename))
     with open(result_filename, 'w') as f:
         f.write(result)
+    if output:
+        output.close()
+    if results:
+        results.save()
+    return result
+
+
+# Number of id ranges trend() uses when no submission dates are known
+TREND_ID_BUCKETS = 10
+
+
+def period_label(ordinal, period):
+    date = datetime.date.fromordinal(ordinal)
+    if period == 'year':
+        return str(date.year)
+    return '{}Q{}'.format(date.year, (date.month - 1) // 3 + 1)
+
+
+def trend(requirements, period, jobs=1, cache=True):
+    '''
+    How many reports and deviceNames pass all of the requirements in each
+    period ('quarter' or 'year') of submission dates, counted in one pass over
+    the reports. Without any submission dates (see fetch-new-data.py), ranges
+    of report ids stand in for periods. The table is printed and saved as CSV.
+    '''
+    store = report_store.load(jobs=jobs)
+    results = result_cache.ResultCache(store) if cache else None
+    with timing.stage('evaluate'):
+        failed_at, _ = first_failures(store, requirements, results)
+    if results:
+        results.save()
+
+    dates = store.estimated_dates()
+    if dates is not None:
+        source = 'submission dates, estimated from the report id where unknown'
+
+        def bucket_of(i):
+            return period_label(dates[i], period)
+    else:
+        source = 'ranges of report ids, as no submission dates are known'
+        size = -(-len(store) // TREND_ID_BUCKETS) or 1
+
+        def bucket_of(i):
+            start = i - i % size
+            return 'ids {}-{}'.format(store.ids[start], store.ids[min(start + size, len(store)) - 1])
+
+    reports = defaultdict(lambda: 0)
+    supported = defaultdict(lambda: 0)
+    ids_by_deviceName = defaultdict(lambda: defaultdict(
+        lambda: dotdict({'supported': [], 'unsupported': []})))
+    for i, report_id in enumerate(store.ids):
+        bucket = bucket_of(i)
+        deviceName = short_deviceName(store.deviceNames[i])
+        reports[bucket] += 1
+        if failed_at[i] == len(requirements):
+            supported[bucket] += 1
+            ids_by_deviceName[bucket][deviceName].supported.append(report_id)
+        else:
+            ids_by_deviceName[bucket][deviceName].unsupported.append(report_id)
+
+    header = ['period', 'reports', 'supported_reports', 'supported_reports_percent',
+              'deviceNames', 'supported_deviceNames', 'supported_deviceNames_percent']
+    rows = []
+    # Id ranges are already in order; estimated dates are sorted.
+    for bucket in (reports if dates is None else sorted(reports)):
+        names = ids_by_deviceName[bucket]
+        names_supported = sum(1 for ids in names.values()
+                              if support_status(ids) == '+')
+        rows.append([bucket, reports[bucket], supported[bucket],
+                     round(supported[bucket] / reports[bucket] * 100, 1),
+                     len(names), names_supported, round(names_supported / len(names) * 100, 1)])
+
+    result = 'Reports passing all requirements by {}, using {}.\n'.format(period, source)
+    result += 'A deviceName is supported if at least 90% of its reports in the period are.\n\n'
+    widths = [max(len(str(row[c])) for row in [header] + rows)
+              for c in range(len(header))]
+    for row in [header] + rows:
+        result += '  '.join(str(v).rjust(w) for v, w in zip(row, widths)) + '\n'
+    print(result)
 
+    result_filename = 'trend-{}.csv'.format(time.strftime("%Y%m%d-%H%M%S"))
+    print('Trend saved to {}'.format(result_filename))
+    with open(result_filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return rows
+
+
+def parse_number(s):
+    try:
+        return int(s, 0)
+    except ValueError:
+        return float(s)
+
+
+def parse_sweep(spec):
+    '''
+    Parse a --sweep argument like 'maxComputeSharedMemorySize>=16384,32768' or
+    'minUniformBufferOffsetAlignment<=32:256:32' (an inclusive start:stop:step
+    range) into (name, index, op, values). The name may be indexed, like
+    'maxComputeWorkGroupSize[0]'.
+    '''
+    m = re.fullmatch(r'(\w+)(?:\[(\d+)\])?(>=|<=)(.+)', spec)
+    if not m:
+        raise ValueError('bad sweep: {}'.format(spec))
+    name, index, op, values = m.groups()
+    index = None if index is None else int(index)
+    try:
+        if ':' in values:
+            start, stop, step = (int(v, 0) for v in values.split(':'))
+            values = list(range(start, stop + 1, step))
+        else:
+            values = [parse_number(v) for v in values.split(',')]
+    except ValueError:
+        raise ValueError('bad sweep values: {}'.format(values))
+    if not values:
+        raise ValueError('no sweep values: {}'.format(spec))
+    return name, index, op, values
+
+
+def constrains_limit(passes, name):
+    '''Whether a requirement compares the named limit, even as part of an any_of/all_of'''
+    if isinstance(passes, (AnyOf, AllOf)):
+        return any(constrains_limit(p, name) for p in passes.predicates)
+    return isinstance(passes, LimitComparison) and passes.name == name
+
+
+def sweep(requirements, name, index, op, values, jobs=1, cache=True):
+    '''
+    For each candidate value of a limit, count how many of the reports (and
+    deviceNames) which pass all of the requirements would be lost by also
+    requiring `limit op value`. This is one pass over the reports, followed by
+    a binary search per value. The table is printed and saved as CSV.
+    '''
+    store = report_store.load(jobs=jobs)
+    limit = name if index is None else '{}[{}]'.format(name, index)
+
+    # Requirements on the swept limit itself (any element of it, alone or
+    # combined with others) would hide the values below them.
+    baseline = [rq for rq in requirements if not constrains_limit(rq.passes, name)]
+    for rq in requirements:
+        if rq not in baseline:
+            print('Ignoring requirement "{}" for the sweep'.format(rq.name))
+    results = result_cache.ResultCache(store) if cache else None
+    with timing.stage('evaluate'):
+        failed_at, _ = first_failures(store, baseline, results)
+    if results:
+        results.save()
+
+    # Sort keys, such that a report is lost for a value x iff key < x.
+    sign = 1 if op == '>=' else -1
+    column = store.limits.column(name)
+    keys = []
+    key_range_by_deviceName = {}
+    for i in range(len(store)):
+        if failed_at[i] < len(baseline):
+            continue
+        try:
+            v = column.get(i)
+            if index is not None:
+                v = v[index]
+            key = sign * try_to_int(v)
+        except (TypeError, ValueError, IndexError):
+            # Reports without the limit fail any value.
+            key = float('-inf')
+        keys.append(key)
+
+        deviceName = short_deviceName(store.deviceNames[i])
+        lo, hi = key_range_by_deviceName.get(deviceName, (key, key))
+        key_range_by_deviceName[deviceName] = (min(lo, key), max(hi, key))
+
+    keys.sort()
+    lows = sorted(lo for lo, hi in key_range_by_deviceName.values())
+    highs = sorted(hi for lo, hi in key_range_by_deviceName.values())
+
+    header = ['value', 'lost_reports', 'lost_reports_percent',
+              'lost_deviceNames', 'partially_lost_deviceNames']
+    rows = []
+    for value in values:
+        x = sign * value
+        lost = bisect.bisect_left(keys, x)
+        all_lost = bisect.bisect_left(highs, x)
+        some_lost = bisect.bisect_left(lows, x) - all_lost
+        rows.append([value, lost, round(lost / len(keys) * 100, 1) if keys else 0,
+                     all_lost, some_lost])
+
+    result = 'Sweeping {} {} X over {} reports ({} deviceNames) passing the other requirements.\n\n'.format(
+        limit, op, len(keys), len(key_range_by_deviceName))
+    widths = [max(len(str(row[c])) for row in [header] + rows)
+              for c in range(len(header))]
+    for row in [header] + rows:
+        result += '  '.join(str(v).rjust(w) for v, w in zip(row, widths)) + '\n'
+    print(result)
 
-def format_supported_with_optimal_tiling_features(formats_map, format, flags):
-    return format in formats_map and (int(formats_map[format]['optimalTilingFeatures']) & flags) == flags
-
-
-def format_supported_with_linear_tiling_features(formats_map, format, flags):
-    return format in formats_map and (int(formats_map[format]['linearTilingFeatures']) & flags) == flags
-
+    result_filename = 'sweep-{}.csv'.format(time.strftime("%Y%m%d-%H%M%S"))
+    print('Sweep saved to {}'.format(result_filename))
+    with open(result_filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return rows
+
+
+def survey(requirements, checks, jobs=1, cache=True):
+    '''
+    For each of the checks (requirements, usually on formats, like those in
+    requirements/webgpu-formats.json), which of the reports and deviceNames
+    passing all of the requirements lack it. Each check is looked at on its
+    own, for every report at once; plain format checks are all evaluated
+    together on the format matrix (see pass_bits()). The table is printed and
+    saved as CSV, with the deviceNames which lack each check in all of their
+    supported reports.
+    '''
+    store = report_store.load(jobs=jobs)
+    results = result_cache.ResultCache(store) if cache else None
+    with timing.stage('evaluate'):
+        failed_at, _ = first_failures(store, requirements, results)
+        passes = pass_bits(store, checks, results)
+    if results:
+        results.save()
+
+    supported = 0
+    supported_by_deviceName = defaultdict(lambda: 0)
+    for i in range(len(store)):
+        if failed_at[i] == len(requirements):
+            supported |= 1 << i
+            supported_by_deviceName[short_deviceName(store.deviceNames[i])] |= 1 << i
+    reports = popcount(supported)
+
+    header = ['check', 'lacking_reports', 'lacking_reports_percent',
+              'lacking_deviceNames', 'partially_lacking_deviceNames']
+    rows = []
+    lacking_by_check = []
+    for check, bits in zip(checks, passes):
+        lacking = supported & ~bits
+        all_lacking = []
+        some_lacking = 0
+        for deviceName, deviceName_bits in sorted(supported_by_deviceName.items()):
+            if deviceName_bits & lacking == deviceName_bits:
+                all_lacking.append(deviceName)
+            elif deviceName_bits & lacking:
+                some_lacking += 1
+        lost = popcount(lacking)
+        rows.append([check.name, lost, round(lost / reports * 100, 1) if reports else 0,
+                     len(all_lacking), some_lacking])
+        lacking_by_check.append(all_lacking)
+
+    result = 'Surveying {} checks over {} reports ({} deviceNames) passing the requirements.\n\n'.format(
+        len(checks), reports, len(supported_by_deviceName))
+    widths = [max(len(str(row[c])) for row in [header] + rows)
+              for c in range(len(header))]
+    for row in [header] + rows:
+        result += '  '.join(str(v).ljust(w) if c == 0 else str(v).rjust(w)
+                            for c, (v, w) in enumerate(zip(row, widths))) + '\n'
+    result += '\nDeviceNames lacking each check in all of their supported reports:\n'
+    for row, all_lacking in zip(rows, lacking_by_check):
+        if all_lacking:
+            result += '  {}: {}\n'.format(row[0], ', '.join(all_lacking))
+    print(result)
 
-def try_to_int(value):
-    if type(value) == str:
-        return int(value, 0)
-    else:
-        return value
+    result_filename = 'survey-{}.csv'.format(time.strftime("%Y%m%d-%H%M%S"))
+    print('Survey saved to {}'.format(result_filename))
+    with open(result_filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header + ['lacking_deviceName_list'])
+        for row, all_lacking in zip(rows, lacking_by_check):
+            writer.writerow(row + ['; '.join(all_lacking)])
+    return rows
 
 
 if __name__ == '__main__':
-    vk = load_vk_enums()
+    # Pass --jobs N to parse new reports in N processes.
+    # Pass --sweep 'limit>=values' to see how many devices each value of a
+    # limit would lose on top of the requirements below; see parse_sweep().
+    # Pass --output jsonl or --output csv to also save the results as records.
+    # Pass --trend quarter or --trend year to see how many devices pass the
+    # requirements below in each period of submission dates; see trend().
+    # Pass --since YYYY-MM-DD to only look at reports submitted since then.
+    # Pass --profile to print where the time went (per stage and per
+    # requirement) and the peak memory use, or --profile-trace FILE to also
+    # save it as a trace for chrome://tracing or https://ui.perfetto.dev.
+    # Pass --cheap-first to evaluate cheap requirements (on the header,
+    # features and extensions) before expensive ones (formats, lambdas). This
+    # is faster, but each lost device is blamed on the cheapest requirement it
+    # fails rather than the first one listed below.
+    # Pass --analyze to follow the result with how much each requirement loses
+    # regardless of the order they are listed in; see analyze().
+    # Pass --no-cache to evaluate every requirement from scratch, without
+    # reading or updating cache/query-results.pickle; see result_cache.py.
+    # Pass --requirements FILE (more than once for several files) to use the
+    # requirements in FILE instead of requirements/default.json.
+    # Pass --survey FILE (e.g. requirements/webgpu-formats.json) to see which
+    # devices passing the requirements lack each of the requirements in FILE,
+    # taken one at a time; see survey().
+    jobs = 1
+    sweep_spec = None
+    output_format = None
+    trend_period = None
+    since = None
+    profile_trace = None
+    cheap = False
+    cache = True
+    analysis = False
+    requirement_filenames = []
+    survey_filename = None
+    opts, args = getopt.getopt(sys.argv[1:], 'j:', [
+        'jobs=', 'sweep=', 'output=', 'trend=', 'since=', 'profile', 'profile-trace=',
+        'cheap-first', 'analyze', 'no-cache', 'requirements=', 'survey='])
+    for o, a in opts:
+        if o in ('-j', '--jobs'):
+            jobs = int(a)
+        elif o == '--sweep':
+            try:
+                sweep_spec = parse_sweep(a)
+            except ValueError as e:
+                print('--sweep: {}'.format(e))
+                sys.exit(1)
+        elif o == '--output':
+            if a not in ('jsonl', 'csv'):
+                print('--output must be jsonl or csv')
+                sys.exit(1)
+            output_format = a
+        elif o == '--trend':
+            if a not in ('quarter', 'year'):
+                print('--trend must be quarter or year')
+                sys.exit(1)
+            trend_period = a
+        elif o == '--since':
+            try:
+                since = datetime.date.fromisoformat(a)
+            except ValueError:
+                print('--since must be a date, as YYYY-MM-DD')
+                sys.exit(1)
+        elif o == '--profile':
+            timing.start()
+        elif o == '--profile-trace':
+            timing.start()
+            profile_trace = a
+        elif o == '--cheap-first':
+            cheap = True
+        elif o == '--analyze':
+            analysis = True
+        elif o == '--no-cache':
+            cache = False
+        elif o == '--requirements':
+            requirement_filenames.append(a)
+        elif o == '--survey':
+            survey_filename = a
+
+    with timing.stage('vk enums'):
+        vk = vk_enums.load()
     requirements = []
     groups = []
-
-    def add_rq(name, passes):
+    scenarios = OrderedDict()
+
+    def add_rq(name, passes, per_profile=False):
+        '''
+        Add a requirement: a predicate, or a function of info. A function is
+        called for every report, unless per_profile=True says it only looks
+        at what a report's capability profile covers (not info.report,
+        info.date or the submitter), in which case it is called once per
+        profile.
+        '''
+        if per_profile and not isinstance(passes, Predicate):
+            passes = Lambda(passes, per_profile=True)
         requirements.append(Rq(name, passes, defaultdict(
             lambda: []), defaultdict(lambda: [])))
 
     def add_min_limit(name, value):
-        add_rq('{} >= {}'.format(name, value),
-               lambda info: info.limits[name] >= value)
+        add_rq('{} >= {}'.format(name, value), MinLimit(name, value))
 
     def add_max_limit(name, value):
-        add_rq('{} <= {}'.format(name, value),
-               lambda info: try_to_int(info.limits[name]) <= value)
+        add_rq('{} <= {}'.format(name, value), MaxLimit(name, value))
 
     def add_bits_limit(name, bits):
-        add_rq('{} has bits 0b{:b}'.format(name, bits),
-               lambda info: (info.limits[name] & bits) == bits)
+        add_rq('{} has bits 0b{:b}'.format(name, bits), BitsLimit(name, bits))
 
     def add_min_opt_property(name, value):
-        add_rq('{} >= {}'.format(name, value),
-               lambda info: (name not in info.properties) or int(info.properties[name]) >= value)
+        add_rq('{} >= {}'.format(name, value), MinOptProperty(name, value))
+
+    def add_feature(name):
+        add_rq(name, Feature(name))
+
+    def add_scenario(name, extra=[]):
+        '''Compare the requirements so far (plus extra) with other scenarios'''
+        scenarios[name] = requirements + [Rq(rq_name, passes, defaultdict(lambda: []), defaultdict(lambda: []))
+                                          for rq_name, passes in extra]
 
     def add_group(name, sort):
         groups.append(Group(name, sort))
@@ -264,141 +772,85 @@ if __name__ == '__main__':
             return "Other"
         groups.append(Group(name, sort))
 
-    # Known requirements
-
-    add_rq('API version variant is 0', lambda info: info.apiVariant == 0)
-    add_rq('API version is 1.x.x', lambda info: info.apiVersion[0] == 1)
-
-    add_rq('robustBufferAccess',
-           lambda info: 'robustBufferAccess' in info.features)
-
-    add_rq('standardSampleLocations',
-           lambda info: info.limits['standardSampleLocations'] == 1)
-
-    add_min_limit('maxBoundDescriptorSets', 4)
-    add_min_limit('maxDescriptorSetUniformBuffersDynamic', 8)
-    add_min_limit('maxDescriptorSetStorageBuffersDynamic', 4)
-    add_min_limit('maxPerStageDescriptorSampledImages', 16)
-    add_min_limit('maxPerStageDescriptorSamplers', 16)
-    add_min_limit('maxPerStageDescriptorStorageBuffers', 8)
-    add_min_limit('maxPerStageDescriptorStorageImages', 4)
-    add_min_limit('maxPerStageDescriptorUniformBuffers', 12)
-
-    add_min_limit('maxUniformBufferRange', 65536)
-    add_min_limit('maxStorageBufferRange', 134217728)
-
-    add_max_limit('minUniformBufferOffsetAlignment', 256)
-    add_max_limit('minStorageBufferOffsetAlignment', 256)
-
-    add_min_limit('maxVertexInputBindings', 8)
-    add_min_limit('maxVertexInputAttributes', 16)
-    add_min_limit('maxVertexInputBindingStride', 2048)
-    add_min_limit('maxVertexInputAttributeOffset', 2047)
-
-    add_min_limit('maxVertexOutputComponents', 68)
-    add_min_limit('maxFragmentInputComponents', 68)
-    add_min_limit('maxComputeSharedMemorySize', 16384)
-    add_min_limit('maxComputeWorkGroupInvocations', 256)
-    add_rq('maxComputeWorkGroupSize >= [256,256,64]',
-           lambda info:
-           info.limits['maxComputeWorkGroupSize'][0] >= 256 and
-           info.limits['maxComputeWorkGroupSize'][1] >= 256 and
-           info.limits['maxComputeWorkGroupSize'][2] >= 64)
-    add_rq('maxComputeWorkGroupCount >= [65535,65535,65535]',
-           lambda info:
-           info.limits['maxComputeWorkGroupCount'][0] >= 65535 and
-           info.limits['maxComputeWorkGroupCount'][1] >= 65535 and
-           info.limits['maxComputeWorkGroupCount'][2] >= 65535)
-
-    add_min_limit('maxColorAttachments', 8)
-    add_min_limit('maxFragmentOutputAttachments', 8)
-    # Most drivers report this limit incorrectly.
-    # https://github.com/gpuweb/gpuweb/issues/3631#issuecomment-1498747606
-    add_rq('maxFragmentCombinedOutputResources >= 8+4+8, OR is intel/nvidia/amd/imgtec',
-           lambda info: info.limits['maxFragmentCombinedOutputResources'] >= 8 + 4 + 8 or
-           info.report['properties']['vendorID'] in [0x8086, 0x10de, 0x1002, 0x1010])
-
-    add_min_limit('maxImageDimension2D', 8192)
-    add_min_limit('maxImageDimensionCube', 8192)
-    add_min_limit('maxFramebufferWidth', 8192)
-    add_min_limit('maxFramebufferHeight', 8192)
-    add_rq('maxViewportDimensions[0] >= 8192',
-           lambda info: info.limits['maxViewportDimensions'][0] >= 8192)
-    add_rq('maxViewportDimensions[1] >= 8192',
-           lambda info: info.limits['maxViewportDimensions'][1] >= 8192)
-    add_rq('viewportBoundsRange[0] <= -8192',
-           lambda info: info.limits['viewportBoundsRange'][0] <= -8192)
-    add_rq('viewportBoundsRange[1] >= 8192',
-           lambda info: info.limits['viewportBoundsRange'][1] >= 8192)
-    add_min_limit('maxImageDimension1D', 8192)
-    add_min_limit('maxImageDimension3D', 2048)
-    add_min_limit('maxImageArrayLayers', 256)
-
-    add_bits_limit('framebufferColorSampleCounts',
-                   vk.SampleCount._1 | vk.SampleCount._4)
-    add_bits_limit('framebufferDepthSampleCounts',
-                   vk.SampleCount._1 | vk.SampleCount._4)
-
-    add_rq('fragmentStoresAndAtomics',
-           lambda info: 'fragmentStoresAndAtomics' in info.features)
-    add_rq('fullDrawIndexUint32',
-           lambda info: 'fullDrawIndexUint32' in info.features)
-    add_rq('depthBiasClamp', lambda info: 'depthBiasClamp' in info.features)
-    add_rq('imageCubeArray', lambda info: 'imageCubeArray' in info.features)
-    add_rq('independentBlend',
-           lambda info: 'independentBlend' in info.features)
-    add_rq('sampleRateShading',
-           lambda info: 'sampleRateShading' in info.features)
-
-    add_rq('has BC || (ETC2 && ASTC LDR 2D)',
-           lambda info: 'textureCompressionBC' in info.features or
-           ('textureCompressionETC2' in info.features and 'textureCompressionASTC_LDR' in info.features))
-
-    add_rq('Vulkan 1.1 or VK_KHR_maintenance2',
-           lambda info: info.apiVersion >= (1, 1, 0) or
-           'VK_KHR_maintenance2' in info.extensions)
-
-    # Texture formats
-
-    ds_required_flags = vk.FormatFeature.SAMPLED_IMAGE | vk.FormatFeature.DEPTH_STENCIL_ATTACHMENT
-    add_rq('depth16unorm', lambda info: format_supported_with_optimal_tiling_features(
-        info.fmts, vk.Format.D16_UNORM, ds_required_flags))
-    add_rq('depth32float', lambda info: format_supported_with_optimal_tiling_features(
-        info.fmts, vk.Format.D32_SFLOAT, ds_required_flags))
-
-    def depth24plus(info):
-        return (format_supported_with_optimal_tiling_features(info.fmts, vk.Format.X8_D24_UNORM, ds_required_flags) or
-                format_supported_with_optimal_tiling_features(info.fmts, vk.Format.D32_SFLOAT, ds_required_flags))
-    add_rq('depth24plus', depth24plus)
-
-    def depth24plus_stencil8(info):
-        return (format_supported_with_optimal_tiling_features(info.fmts, vk.Format.D24_UNORM_S8_UINT, ds_required_flags) or
-                format_supported_with_optimal_tiling_features(info.fmts, vk.Format.D32_SFLOAT_S8_UINT, ds_required_flags))
-    add_rq('depth24plus-stencil8', depth24plus_stencil8)
-
-    def any_s8(info):
-        return (format_supported_with_optimal_tiling_features(info.fmts, vk.Format.D24_UNORM_S8_UINT, ds_required_flags) or
-                format_supported_with_optimal_tiling_features(info.fmts, vk.Format.D16_UNORM_S8_UINT, ds_required_flags) or
-                format_supported_with_optimal_tiling_features(info.fmts, vk.Format.D32_SFLOAT_S8_UINT, ds_required_flags) or
-                format_supported_with_optimal_tiling_features(info.fmts, vk.Format.S8_UINT, ds_required_flags))
-    add_rq('stencil8 any format', any_s8)
-
-    def d24s8_or_s8(info):
-        return (format_supported_with_optimal_tiling_features(info.fmts, vk.Format.D24_UNORM_S8_UINT, ds_required_flags) or
-                format_supported_with_optimal_tiling_features(info.fmts, vk.Format.S8_UINT, ds_required_flags))
-    add_rq('stencil8 <= 4 bytes', d24s8_or_s8)
-
-    add_min_opt_property('maxMemoryAllocationSize', 268435456)
-    add_min_opt_property('maxBufferSize', 268435456)
-
-    # Additional requirements?
+    if since:
+        add_rq('submitted since {}'.format(since), SubmittedSince(since))
+
+    # Known requirements, from requirements/default.json unless other files
+    # are given with --requirements; see requirement_files.py. Their scenarios
+    # are added at the end, so that they have every requirement.
+    file_scenarios = []
+    for filename in requirement_filenames or [requirement_files.DEFAULT_FILE]:
+        try:
+            loaded = requirement_files.load(filename, vk)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        for name, passes in loaded.requirements:
+            add_rq(name, passes)
+        file_scenarios.extend(loaded.scenarios.items())
+
+    # Additional requirements? Declarative ones can go in a requirement file
+    # instead; lambdas (add_rq(name, lambda info: ...)) can only go here.
+
+    # Scenario example:
+    # Uncommenting the following lines would compare the requirements above
+    # with a proposed limit bump, and list the devices which it would lose.
+
+    # add_scenario('Current')
+    # add_scenario('maxComputeSharedMemorySize 32768', [
+    #     ('maxComputeSharedMemorySize >= 32768', MinLimit('maxComputeSharedMemorySize', 32768))])
 
     # Grouping example:
     # Uncommenting the following lines would generate some basic stats on Android OS versions and GPUs
     # that meet all of the above criteria.
 
-    # add_rq("Android", lambda info: info.report['environment']['name'] == "android")
-    # add_group("OS Version", lambda info: info.report['environment']['version'].split('.')[0])
-    # add_substr_group("GPU", lambda info: info.report['properties']['deviceName'], ['Mali', 'Adreno', 'PowerVR', 'Tegra'])
-
-    run(requirements, groups)
+    # add_rq("Android", lambda info: info.environment['name'] == "android")
+    # add_group("OS Version", lambda info: info.environment['version'].split('.')[0])
+    # add_substr_group("GPU", lambda info: info.header['deviceName'], ['Mali', 'Adreno', 'PowerVR', 'Tegra'])
+
+    for name, extra in file_scenarios:
+        add_scenario(name, extra)
+
+    # Without any submission dates, requirements on them would silently fail
+    # every report.
+    def uses_dates(passes):
+        if isinstance(passes, (AnyOf, AllOf)):
+            return any(uses_dates(p) for p in passes.predicates)
+        return isinstance(passes, SubmittedSince)
+    if (any(uses_dates(rq.passes) for rq in requirements) or
+            any(uses_dates(rq.passes) for rqs in scenarios.values() for rq in rqs)):
+        if not report_store.load_dates():
+            print('Submission dates are needed (e.g. for --since), but there are none in {}. '
+                  'fetch-new-data.py saves them there.'.format(report_store.DATES_FILE))
+            sys.exit(1)
+
+    if cheap:
+        print('Evaluating cheap requirements first; devices are blamed on the cheapest requirement they fail.')
+        requirements = cheap_first(requirements)
+        for name in scenarios:
+            scenarios[name] = cheap_first(scenarios[name])
+
+    if survey_filename:
+        try:
+            checks = requirement_files.load(survey_filename, vk).requirements
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        survey(requirements, [Rq(name, passes, defaultdict(lambda: []), defaultdict(lambda: []))
+                              for name, passes in checks], jobs=jobs, cache=cache)
+    elif sweep_spec:
+        sweep(requirements, *sweep_spec, jobs=jobs, cache=cache)
+    elif trend_period:
+        trend(requirements, trend_period, jobs=jobs, cache=cache)
+    elif scenarios:
+        run_scenarios(scenarios, groups, jobs=jobs,
+                      output_format=output_format, cache=cache, analysis=analysis)
+    else:
+        run(requirements, groups, jobs=jobs, output_format=output_format, cache=cache,
+            analysis=analysis)
+
+    if timing.enabled():
+        print(timing.summary())
+        if profile_trace:
+            timing.dump(profile_trace)
+            print('Trace saved to {}'.format(profile_trace))
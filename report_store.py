@@ -0,0 +1,1424 @@
+#!/usr/bin/python3
+# Format this file with python3 -m autopep8 -i report_store.py
+
+# Builds a compact columnar store of everything query.py and device_id.py need
+# from data/reports/*.json (or *.json.gz or *.json.zst), so that they don't have
+# to json.load every report on every run. Only the fields the queries use are
+# decoded from each report (see json_project.py). Numeric limits and properties
+# are kept as typed arrays, features and extensions as per-report bitsets, and
+# format tiling flags as a dense matrix, which is saved in a file of its own and
+# memory-mapped.
+#
+# Run this script directly to (re)build the store; pass --jobs N to parse
+# reports in N processes. query.py and device_id.py also build it on demand,
+# and bring it up to date by parsing only the reports which are new or changed
+# since it was last saved.
+
+from array import array
+import bisect
+import collections.abc
+import copy
+import datetime
+import getopt
+import glob
+import gzip
+import hashlib
+import io
+import json
+import json_project
+import mmap
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+import timing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STORE_VERSION = 6
+REPORTS_DIR = os.path.join('data', 'reports')
+STORE_FILE = os.path.join('cache', 'report-store.pickle')
+# Submission dates of reports, saved by fetch-new-data.py
+DATES_FILE = os.path.join('cache', 'report-dates.json')
+# Suffixes of report files, by compression
+COMPRESSION_SUFFIXES = {None: '.json', 'gzip': '.json.gz', 'zstd': '.json.zst'}
+# Number of reports handed to a worker process at a time
+CHUNK_SIZE = 64
+# The parts of a report normalize_report() looks at (see json_project.py).
+# Everything else, like queues, memory heaps and surface info, is skipped
+# without being decoded.
+REPORT_FIELDS = {
+    'properties': True,
+    'environment': True,
+    'features': True,
+    'extensions': True,
+    'formats': True,
+    'core1*': {'features': True, 'properties': True},
+    'extended': {'devicefeatures2': True, 'deviceproperties2': True},
+}
+
+# Environment fields which say who submitted a report rather than anything
+# about the device, and so are left out of its capability fingerprint
+UNFINGERPRINTED_ENVIRONMENT = ('submitter', 'comment')
+
+# Stores kept in memory by hold(), by (reports_dir, store_file)
+_held = {}
+
+
+class dotdict(dict):
+    '''dot.notation access to dictionary attributes'''
+    __getattr__ = dict.get
+    __setattr__ = dict.__setitem__
+    __delattr__ = dict.__delitem__
+
+
+def _typecode_for(value):
+    '''The narrowest column type which can hold value exactly'''
+    if type(value) == int:
+        if -(1 << 63) <= value < (1 << 63):
+            return 'q'
+        if 0 <= value < (1 << 64):
+            return 'Q'
+    elif type(value) == float:
+        return 'd'
+    # bools, strings, lists etc. are kept as Python objects so that
+    # requirements see exactly what was in the report.
+    return 'O'
+
+
+class Column:
+    '''One value per report, in a typed array where the values allow it.'''
+
+    def __init__(self, length=0):
+        self.typecode = None
+        self.values = [None] * length
+        self.present = bytearray(length)
+        self.negative = False
+
+    def _promote(self, typecode):
+        if self.typecode is None:
+            if typecode == 'O':
+                self.values = list(self.values)
+            else:
+                self.values = array(typecode, [0] * len(self.values))
+        elif typecode == 'O':
+            values = [None] * len(self.values)
+            for i, present in enumerate(self.present):
+                if present:
+                    values[i] = self.values[i]
+            self.values = values
+        else:
+            self.values = array(typecode, self.values)
+        self.typecode = typecode
+
+    def append(self, value):
+        typecode = _typecode_for(value)
+        if typecode != self.typecode:
+            if self.typecode is None:
+                self._promote(typecode)
+            elif self.typecode == 'q' and typecode == 'Q' and not self.negative:
+                self._promote('Q')
+            elif self.typecode == 'Q' and typecode == 'q' and value >= 0:
+                pass
+            elif self.typecode != 'O':
+                self._promote('O')
+        if typecode == 'q' and value < 0:
+            self.negative = True
+        self.values.append(value)
+        self.present.append(1)
+
+    def append_absent(self):
+        self.values.append(None if self.typecode in (None, 'O') else 0)
+        self.present.append(0)
+
+    def extend_absent(self, n):
+        self.values.extend([None] * n if self.typecode in (None, 'O') else array(self.typecode, [0] * n))
+        self.present.extend(bytes(n))
+
+    def extend(self, other):
+        '''Append the values of another column, as if they were appended one by one'''
+        if other.typecode is None:
+            self.extend_absent(len(other.present))
+            return
+        if self.typecode is None:
+            self._promote(other.typecode)
+        if self.typecode == other.typecode:
+            self.values.extend(other.values)
+            self.present.extend(other.present)
+            self.negative = self.negative or other.negative
+            return
+        # The types differ, so they are worked out value by value.
+        for value, present in zip(other.values, other.present):
+            if present:
+                self.append(value)
+            else:
+                self.append_absent()
+
+    def slice(self, start, stop):
+        '''A column of the values start:stop'''
+        column = Column()
+        column.typecode = self.typecode
+        column.values = self.values[start:stop]
+        column.present = self.present[start:stop]
+        column.negative = self.typecode == 'q' and min(column.values, default=0) < 0
+        return column
+
+    def get(self, i):
+        if self.present[i]:
+            return self.values[i]
+        return None
+
+    def state(self):
+        return (self.typecode, self.values, bytes(self.present), self.negative)
+
+    @staticmethod
+    def from_state(state):
+        column = Column()
+        (column.typecode, column.values, present, column.negative) = state
+        column.present = bytearray(present)
+        return column
+
+
+class ColumnTable:
+    '''A set of named Columns, appended to a whole report at a time.'''
+
+    def __init__(self):
+        self.length = 0
+        self.columns = {}
+        self._rows = None
+
+    def append(self, values):
+        for name, value in values.items():
+            if name not in self.columns:
+                self.columns[name] = Column(self.length)
+        for name, column in self.columns.items():
+            if name in values:
+                column.append(values[name])
+            else:
+                column.append_absent()
+        self.length += 1
+        self._rows = None
+
+    def extend(self, other):
+        '''Append every row of another table'''
+        for name in other.columns:
+            if name not in self.columns:
+                self.columns[name] = Column(self.length)
+        for name, column in self.columns.items():
+            if name in other.columns:
+                column.extend(other.columns[name])
+            else:
+                column.extend_absent(other.length)
+        self.length += other.length
+        self._rows = None
+
+    def slice(self, start, stop):
+        '''A table of the rows start:stop'''
+        table = ColumnTable()
+        table.length = stop - start
+        table.columns = {name: column.slice(start, stop) for name, column in self.columns.items()}
+        return table
+
+    def column(self, name):
+        '''The named column, or an all-absent one if no report has it'''
+        if name in self.columns:
+            return self.columns[name]
+        return Column(self.length)
+
+    def row(self, i):
+        if self._rows is None:
+            self._rows = [(name, column.values if type(column.values) == list else column.values.tolist(), column.present)
+                          for name, column in self.columns.items()]
+        return {name: values[i] for name, values, present in self._rows if present[i]}
+
+    def state(self):
+        return (self.length, {name: column.state() for name, column in self.columns.items()})
+
+    @staticmethod
+    def from_state(state):
+        table = ColumnTable()
+        table.length, columns = state
+        table.columns = {name: Column.from_state(column)
+                         for name, column in columns.items()}
+        return table
+
+
+class Row(collections.abc.Mapping):
+    '''One report's values in a ColumnTable, read from the columns on demand.'''
+    __slots__ = ('table', 'i')
+
+    def __init__(self, table, i):
+        self.table = table
+        self.i = i
+
+    def __getitem__(self, name):
+        column = self.table.columns.get(name)
+        if column is None or not column.present[self.i]:
+            raise KeyError(name)
+        return column.values[self.i]
+
+    def __iter__(self):
+        return (name for name, column in self.table.columns.items()
+                if column.present[self.i])
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class NameSet:
+    '''Per-report sets of names (features, extensions) stored as bitsets.'''
+
+    def __init__(self):
+        self.names = []
+        self.bits = {}
+        self.rows = []
+
+    def append(self, names):
+        row = 0
+        for name in names:
+            if name not in self.bits:
+                self.bits[name] = len(self.names)
+                self.names.append(name)
+            row |= 1 << self.bits[name]
+        self.rows.append(row)
+
+    def extend(self, other):
+        '''Append every row of another NameSet, whose names may have other bits'''
+        mapping = []
+        for name in other.names:
+            if name not in self.bits:
+                self.bits[name] = len(self.names)
+                self.names.append(name)
+            mapping.append(self.bits[name])
+        if mapping == list(range(len(mapping))):
+            self.rows.extend(other.rows)
+            return
+        # Rows are moved to the new bits a byte at a time. Reports from the
+        # same device have the same bytes, so each is only worked out once.
+        remapped = [{} for _ in range(0, len(mapping), 8)]
+        for row in other.rows:
+            new = 0
+            b = 0
+            while row:
+                v = row & 255
+                if v:
+                    bits = remapped[b].get(v)
+                    if bits is None:
+                        bits = 0
+                        for j in range(8):
+                            if v >> j & 1:
+                                bits |= 1 << mapping[8 * b + j]
+                        remapped[b][v] = bits
+                    new |= bits
+                row >>= 8
+                b += 1
+            self.rows.append(new)
+
+    def row(self, i):
+        row = self.rows[i]
+        return set(name for bit, name in enumerate(self.names) if row >> bit & 1)
+
+    def view(self, i):
+        return NameSetRow(self, self.rows[i])
+
+    def state(self):
+        return (self.names, self.rows)
+
+    @staticmethod
+    def from_state(state):
+        nameset = NameSet()
+        nameset.names, nameset.rows = state
+        nameset.bits = {name: bit for bit, name in enumerate(nameset.names)}
+        return nameset
+
+
+class NameSetRow(collections.abc.Set):
+    '''One report's set of names in a NameSet, tested against its bitset.'''
+    __slots__ = ('nameset', 'bits')
+
+    def __init__(self, nameset, bits):
+        self.nameset = nameset
+        self.bits = bits
+
+    @classmethod
+    def _from_iterable(cls, names):
+        return set(names)
+
+    def __contains__(self, name):
+        bit = self.nameset.bits.get(name)
+        return bit is not None and self.bits >> bit & 1 == 1
+
+    def __iter__(self):
+        return (name for bit, name in enumerate(self.nameset.names) if self.bits >> bit & 1)
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __repr__(self):
+        return repr(set(self))
+
+
+class FormatTable:
+    '''
+    Format tiling flags as a dense (VkFormat x format profile) matrix.
+
+    Reports from the same driver almost always share the exact same format
+    table, so each distinct table (a "profile") is stored once and each report
+    refers to its profile by index.
+
+    The matrix is saved to its own file next to the store (see
+    matrix_filename()), one VkFormat after another, and memory-mapped when the
+    store is loaded. A query then only reads the pages of the formats it looks
+    at, and each format's flags are a contiguous slice which NumPy wraps
+    without copying (see predicates.ReportArrays.format_matrix()). While
+    reports are being appended, the matrix is kept in memory one profile after
+    another instead, so that profiles can be added to the end.
+    '''
+    # The arrays of the matrix, in the order they are saved: the flags of each
+    # tiling (uint64), and whether the profile has the format at all (uint8)
+    ARRAYS = ('optimal', 'linear', 'buffer', 'present')
+
+    def __init__(self):
+        self.formats = []
+        self.column = {}
+        self.profiles = 0
+        self.profile = array('L')
+        # The arrays by name: array('Q')s and a bytearray one profile after
+        # another, or memoryviews of the mapped file one format after another
+        self.arrays = {name: array('Q') for name in self.ARRAYS[:3]}
+        self.arrays['present'] = bytearray()
+        self.format_major = False
+        # Identifies the matrix file which goes with the pickled table
+        self.token = None
+        # The file the arrays are mapped from, if they are
+        self.mapped_from = None
+        self._index = None
+        # Format maps already built by row(), and digests by digest(), by
+        # profile
+        self._rows = {}
+        self._digests = {}
+
+    def _offset(self, p, c):
+        if self.format_major:
+            return c * self.profiles + p
+        return p * len(self.formats) + c
+
+    def _key(self, p):
+        optimal, linear, buffer, present = (self.arrays[name] for name in self.ARRAYS)
+        key = []
+        for c, fmt in enumerate(self.formats):
+            o = self._offset(p, c)
+            if present[o]:
+                key.append((fmt, optimal[o], linear[o], buffer[o]))
+        return tuple(key)
+
+    def _transposed(self, name):
+        '''The bytes of an array, from one layout to the other'''
+        values = self.arrays[name]
+        rows, columns = len(self.formats), self.profiles
+        if not self.format_major:
+            rows, columns = columns, rows
+        if numpy is not None and rows and columns:
+            dtype = numpy.uint8 if name == 'present' else numpy.uint64
+            return numpy.frombuffer(values, dtype=dtype).reshape(rows, columns).T.tobytes()
+        transposed = [values[r * columns + c] for c in range(columns) for r in range(rows)]
+        return bytes(transposed) if name == 'present' else array('Q', transposed).tobytes()
+
+    def _unmap(self):
+        '''Copy the mapped arrays into memory, one profile after another'''
+        arrays = {}
+        for name in self.ARRAYS:
+            if name == 'present':
+                arrays[name] = bytearray(self._transposed(name))
+            else:
+                arrays[name] = array('Q')
+                arrays[name].frombytes(self._transposed(name))
+        self.arrays = arrays
+        self.format_major = False
+        self.mapped_from = None
+
+    def _widen(self, formats):
+        old = [self._key(p) for p in range(self.profiles)]
+        self.formats = sorted(set(self.formats) | set(formats))
+        self.column = {fmt: c for c, fmt in enumerate(self.formats)}
+        self.arrays = {name: array('Q') for name in self.ARRAYS[:3]}
+        self.arrays['present'] = bytearray()
+        self.profiles = 0
+        for key in old:
+            self._add_profile(key)
+
+    def _add_profile(self, key):
+        width = len(self.formats)
+        for name in self.ARRAYS:
+            self.arrays[name].extend(bytes(width) if name == 'present' else [0] * width)
+        row = self.profiles * width
+        for fmt, optimal, linear, buffer in key:
+            c = self.column[fmt]
+            self.arrays['optimal'][row + c] = optimal
+            self.arrays['linear'][row + c] = linear
+            self.arrays['buffer'][row + c] = buffer
+            self.arrays['present'][row + c] = 1
+        self.profiles += 1
+
+    def _profile_for(self, key):
+        '''The profile with the given key, added if there isn't one yet'''
+        if self._index is None:
+            self._index = {self._key(p): p for p in range(self.profiles)}
+        p = self._index.get(key)
+        if p is None:
+            if self.format_major:
+                self._unmap()
+            if any(fmt not in self.column for fmt, *_ in key):
+                self._widen(fmt for fmt, *_ in key)
+                self._rows = {}
+            p = self.profiles
+            self._add_profile(key)
+            self._index[key] = p
+        return p
+
+    def append(self, formats):
+        key = tuple(sorted((fmt, int(props.get('optimalTilingFeatures', 0)), int(props.get('linearTilingFeatures', 0)),
+                            int(props.get('bufferFeatures', 0))) for fmt, props in formats.items()))
+        self.profile.append(self._profile_for(key))
+
+    def extend(self, other):
+        '''Append the reports of another table, matching up their profiles'''
+        mapping = [self._profile_for(other._key(p)) for p in range(other.profiles)]
+        self.profile.extend(mapping[p] for p in other.profile)
+
+    def row(self, i):
+        '''
+        The format map of a report. Reports with the same profile share the
+        same map, so it must not be modified.
+        '''
+        p = self.profile[i]
+        if p not in self._rows:
+            self._rows[p] = self._profile_row(p)
+        return self._rows[p]
+
+    def digest(self, p):
+        '''
+        What identifies the format table of profile p, whatever its index.
+        Profiles are renumbered when the store is rebuilt by merge().
+        '''
+        if p not in self._digests:
+            self._digests[p] = hashlib.blake2b(repr(self._key(p)).encode('utf-8'), digest_size=16).digest()
+        return self._digests[p]
+
+    def _profile_row(self, p):
+        m = dotdict()
+        for fmt, optimal, linear, buffer in self._key(p):
+            m[fmt] = {
+                'format': fmt,
+                'optimalTilingFeatures': optimal,
+                'linearTilingFeatures': linear,
+                'bufferFeatures': buffer,
+            }
+        return m
+
+    def save(self, filename):
+        '''Save the matrix to filename, one format after another'''
+        if self.mapped_from == filename:
+            return
+        self.token = os.urandom(16)
+        with open(filename + '.tmp', 'wb') as f:
+            f.write(self.token)
+            for name in self.ARRAYS:
+                f.write(self.arrays[name] if self.format_major else self._transposed(name))
+        os.replace(filename + '.tmp', filename)
+
+    def map(self, filename):
+        '''
+        Memory-map the matrix saved by save(). False if the file is missing or
+        wasn't saved with this table.
+        '''
+        cells = len(self.formats) * self.profiles
+        try:
+            with open(filename, 'rb') as f:
+                if (os.fstat(f.fileno()).st_size != len(self.token) + cells * 25 or
+                        f.read(len(self.token)) != self.token):
+                    return False
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, TypeError):
+            return False
+        offset = len(self.token)
+        for name in self.ARRAYS:
+            size = cells if name == 'present' else cells * 8
+            self.arrays[name] = view[offset:offset + size]
+            if name != 'present':
+                self.arrays[name] = self.arrays[name].cast('Q')
+            offset += size
+        self.format_major = True
+        self.mapped_from = filename
+        self._rows = {}
+        return True
+
+    def state(self):
+        # The matrix itself is saved by save()
+        return (self.formats, self.profiles, self.token, self.profile)
+
+    @staticmethod
+    def from_state(state):
+        '''A table whose matrix must then be loaded with map()'''
+        table = FormatTable()
+        table.formats, table.profiles, table.token, table.profile = state
+        table.column = {fmt: c for c, fmt in enumerate(table.formats)}
+        return table
+
+
+# How ReportInfo makes each of its views of the store
+_INFO_VIEWS = {
+    'header': lambda store, i: Row(store.header, i),
+    'environment': lambda store, i: Row(store.environment, i),
+    'limits': lambda store, i: Row(store.limits, i),
+    'properties': lambda store, i: Row(store.properties, i),
+    'features': lambda store, i: store.features.view(i),
+    'extensions': lambda store, i: store.extensions.view(i),
+}
+
+
+class ReportInfo:
+    '''
+    The per-report record used by query.py requirements. It holds no values
+    itself: limits, properties etc. are views of the store's columns, each
+    made the first time it is used, and report (the report's original JSON)
+    is only read from its file the first time it is used. A report which
+    fails a requirement on its header costs no more than that.
+    '''
+    __slots__ = ('store', 'i', 'header', 'environment', 'limits',
+                 'properties', 'features', 'extensions', '_report')
+
+    def __init__(self, store, i):
+        self.store = store
+        self.i = i
+        self._report = None
+
+    def __getattr__(self, name):
+        # Only called for views which haven't been made yet
+        if name not in _INFO_VIEWS:
+            raise AttributeError(name)
+        view = _INFO_VIEWS[name](self.store, self.i)
+        setattr(self, name, view)
+        return view
+
+    @property
+    def apiVariant(self):
+        return self.header['apiVersion'] >> 29
+
+    @property
+    def apiVersion(self):
+        apiVersion = self.header['apiVersion']
+        return (
+            (apiVersion >> 22) & 0b1111111,
+            (apiVersion >> 12) & 0b1111111111,
+            apiVersion & 0b111111111111,
+        )
+
+    @property
+    def fmts(self):
+        return self.store.formats.row(self.i)
+
+    @property
+    def date(self):
+        '''The (possibly estimated) submission date, or None if no dates are known'''
+        dates = self.store.estimated_dates()
+        return datetime.date.fromordinal(dates[self.i]) if dates else None
+
+    @property
+    def report(self):
+        if self._report is None:
+            self._report = self.store.raw_report(self.i)
+        return self._report
+
+
+def normalize_report(report):
+    '''
+    Extract the parts of a report the queries look at: the core1x and
+    extended features/properties are merged and properties are coerced to
+    numbers where possible.
+    '''
+    info = dotdict()
+    info.header = {k: v for k, v in report['properties'].items()
+                   if type(v) != dict}
+    info.environment = report.get('environment', {})
+    info.limits = report['properties']['limits']
+
+    info.fmts = {}
+    for fmt in report['formats']:
+        info.fmts[fmt[0]] = fmt[1]
+
+    info.features = set([k for (k, v) in report['features'].items() if v])
+    info.extensions = set(e['extensionName'] for e in report['extensions'])
+    for core1x in report:
+        if core1x.startswith('core1') and 'features' in report[core1x]:
+            for k, v in report[core1x]['features'].items():
+                if v:
+                    info.features.add(k)
+    if 'extended' in report and 'devicefeatures2' in report['extended']:
+        for v in report['extended']['devicefeatures2']:
+            if v['supported']:
+                info.features.add(v['name'])
+
+    info.properties = {}
+    for core1x in report:
+        if core1x.startswith('core1') and 'properties' in report[core1x]:
+            for k, v in report[core1x]['properties'].items():
+                info.properties[k] = v
+    if 'extended' in report and 'deviceproperties2' in report['extended']:
+        for v in report['extended']['deviceproperties2']:
+            # These entries tell us which extension they come from, too,
+            # but we just ignore that for now since we don't need it.
+            info.properties[v['name']] = v['value']
+
+    # Normalize properties to numbers where possible
+    for k, v in info.properties.items():
+        if v == 'true':
+            v = 1
+        elif v == 'false':
+            v = 0
+        elif type(v) == str:
+            try:
+                v = int(v)
+            except ValueError:
+                try:
+                    v = float(v)
+                except ValueError:
+                    pass
+        info.properties[k] = v
+
+    return info
+
+
+class ReportStore:
+    '''All reports in data/reports, ordered by report id.'''
+
+    def __init__(self):
+        self.ids = array('q')
+        self.errors = []
+        # (size, mtime) of every report file, by report id
+        self.files = {}
+        self.deviceNames = []
+        self.header = ColumnTable()
+        self.environment = ColumnTable()
+        self.limits = ColumnTable()
+        self.properties = ColumnTable()
+        self.features = NameSet()
+        self.extensions = NameSet()
+        self.formats = FormatTable()
+        # Reports which are identical in everything the queries can look at
+        # (other than info.report) have the same capability profile. These
+        # are the profile of each report, and the fingerprint of each profile.
+        self.capability = array('L')
+        self.fingerprints = []
+        self._fingerprint_index = None
+        # Submission date of each report as a date ordinal (0 if unknown), and
+        # the file_key() of the dates file they came from
+        self.dates = array('l')
+        self.dates_key = None
+        # (len(ids), estimated_dates()) as of the last call
+        self._estimated_dates = None
+        # Where raw_report() finds report files; set by load()
+        self.reports_dir = REPORTS_DIR
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def file_count(self):
+        '''Number of report files, including ones which failed to parse.'''
+        return len(self.ids) + len(self.errors)
+
+    def append(self, report_id, info):
+        self.ids.append(report_id)
+        self.deviceNames.append(sys.intern(
+            info.header.get('deviceName', '[unknown]')))
+        self.header.append(info.header)
+        self.environment.append(info.environment)
+        self.limits.append(info.limits)
+        self.properties.append(info.properties)
+        self.features.append(info.features)
+        self.extensions.append(info.extensions)
+        self.formats.append(info.fmts)
+
+        environment = {k: v for k, v in info.environment.items()
+                       if k not in UNFINGERPRINTED_ENVIRONMENT}
+        # The format table is fingerprinted by the digest of its profile,
+        # which was just worked out by FormatTable.append().
+        content = (sorted(info.header.items()), sorted(environment.items()),
+                   sorted(info.limits.items()), sorted(info.properties.items()),
+                   sorted(info.features), sorted(info.extensions),
+                   self.formats.digest(self.formats.profile[-1]))
+        fingerprint = hashlib.blake2b(
+            repr(content).encode('utf-8'), digest_size=16).digest()
+        if self._fingerprint_index is None:
+            self._fingerprint_index = {f: c for c, f in enumerate(self.fingerprints)}
+        c = self._fingerprint_index.get(fingerprint)
+        if c is None:
+            c = len(self.fingerprints)
+            self.fingerprints.append(fingerprint)
+            self._fingerprint_index[fingerprint] = c
+        self.capability.append(c)
+
+    def extend(self, other):
+        '''
+        Append every report of another store, in order, as if each had been
+        appended. Worker processes build stores of their reports (see
+        _build_chunk()), which are put together this way.
+        '''
+        self.ids.extend(other.ids)
+        self.deviceNames.extend(sys.intern(deviceName) for deviceName in other.deviceNames)
+        self.header.extend(other.header)
+        self.environment.extend(other.environment)
+        self.limits.extend(other.limits)
+        self.properties.extend(other.properties)
+        self.features.extend(other.features)
+        self.extensions.extend(other.extensions)
+        self.formats.extend(other.formats)
+
+        # Fingerprints only depend on what is in the reports, so they are the
+        # same whichever store worked them out.
+        if self._fingerprint_index is None:
+            self._fingerprint_index = {f: c for c, f in enumerate(self.fingerprints)}
+        mapping = []
+        for fingerprint in other.fingerprints:
+            c = self._fingerprint_index.get(fingerprint)
+            if c is None:
+                c = len(self.fingerprints)
+                self.fingerprints.append(fingerprint)
+                self._fingerprint_index[fingerprint] = c
+            mapping.append(c)
+        self.capability.extend(mapping[c] for c in other.capability)
+
+    def _copy_rows(self, old, start, stop):
+        '''
+        Append the rows start:stop of old, whose names, format profiles and
+        capability profiles this store shares (see merge()), a column at a time
+        '''
+        self.ids.extend(old.ids[start:stop])
+        self.deviceNames.extend(old.deviceNames[start:stop])
+        self.header.extend(old.header.slice(start, stop))
+        self.environment.extend(old.environment.slice(start, stop))
+        self.limits.extend(old.limits.slice(start, stop))
+        self.properties.extend(old.properties.slice(start, stop))
+        self.features.rows.extend(old.features.rows[start:stop])
+        self.extensions.rows.extend(old.extensions.rows[start:stop])
+        self.formats.profile.extend(old.formats.profile[start:stop])
+        self.capability.extend(old.capability[start:stop])
+
+    def _drop_unused_profiles(self):
+        '''Forget the capability profiles no report has any more'''
+        used = sorted(set(self.capability))
+        if len(used) == len(self.fingerprints):
+            return
+        new_index = {c: k for k, c in enumerate(used)}
+        self.fingerprints = [self.fingerprints[c] for c in used]
+        self.capability = array(self.capability.typecode, (new_index[c] for c in self.capability))
+        self._fingerprint_index = None
+
+    def capability_reports(self):
+        '''The index of the first report with each capability profile'''
+        first = [None] * len(self.fingerprints)
+        for i, c in enumerate(self.capability):
+            if first[c] is None:
+                first[c] = i
+        return first
+
+    def estimated_dates(self):
+        '''
+        The submission date of every report as a date ordinal. Where a date
+        isn't known it is interpolated from the nearest reports with known
+        dates, since report ids increase over time. None if no dates are known.
+        '''
+        if self._estimated_dates is None or self._estimated_dates[0] != len(self.ids):
+            self._estimated_dates = (len(self.ids), self._estimate_dates())
+        return self._estimated_dates[1]
+
+    def _estimate_dates(self):
+        known = [(report_id, date) for report_id, date in zip(self.ids, self.dates) if date]
+        if not known:
+            return None
+        known_ids = [report_id for report_id, _ in known]
+        estimated = []
+        for report_id, date in zip(self.ids, self.dates):
+            if not date:
+                j = bisect.bisect_left(known_ids, report_id)
+                if j == 0:
+                    date = known[0][1]
+                elif j == len(known):
+                    date = known[-1][1]
+                else:
+                    (id0, date0), (id1, date1) = known[j - 1], known[j]
+                    date = date0 + (date1 - date0) * (report_id - id0) // (id1 - id0)
+            estimated.append(date)
+        return estimated
+
+    def normalized(self, i):
+        '''The normalized record of a report, as from normalize_report()'''
+        info = dotdict()
+        info.header = self.header.row(i)
+        info.environment = self.environment.row(i)
+        info.limits = self.limits.row(i)
+        info.properties = self.properties.row(i)
+        info.features = self.features.row(i)
+        info.extensions = self.extensions.row(i)
+        info.fmts = self.formats.row(i)
+        return info
+
+    def info(self, i):
+        '''The per-report info record used by query.py requirements.'''
+        return ReportInfo(self, i)
+
+    def raw_report(self, i):
+        '''The original JSON of a report, read from its file'''
+        for suffix in COMPRESSION_SUFFIXES.values():
+            filename = os.path.join(self.reports_dir, str(self.ids[i]) + suffix)
+            if os.path.exists(filename):
+                with open_report(filename) as f:
+                    return json.load(f)
+        raise FileNotFoundError('no file for report {}'.format(self.ids[i]))
+
+    def state(self):
+        return {
+            'version': STORE_VERSION,
+            'ids': self.ids,
+            'errors': self.errors,
+            'files': self.files,
+            'deviceNames': self.deviceNames,
+            'header': self.header.state(),
+            'environment': self.environment.state(),
+            'limits': self.limits.state(),
+            'properties': self.properties.state(),
+            'features': self.features.state(),
+            'extensions': self.extensions.state(),
+            'formats': self.formats.state(),
+            'capability': self.capability,
+            'fingerprints': self.fingerprints,
+            'dates': self.dates,
+            'dates_key': self.dates_key,
+        }
+
+    @staticmethod
+    def from_state(state):
+        store = ReportStore()
+        store.ids = state['ids']
+        store.errors = state['errors']
+        store.files = state['files']
+        store.deviceNames = state['deviceNames']
+        store.header = ColumnTable.from_state(state['header'])
+        store.environment = ColumnTable.from_state(state['environment'])
+        store.limits = ColumnTable.from_state(state['limits'])
+        store.properties = ColumnTable.from_state(state['properties'])
+        store.features = NameSet.from_state(state['features'])
+        store.extensions = NameSet.from_state(state['extensions'])
+        store.formats = FormatTable.from_state(state['formats'])
+        store.capability = state['capability']
+        store.fingerprints = state['fingerprints']
+        store.dates = state['dates']
+        store.dates_key = state['dates_key']
+        return store
+
+
+def open_report(filename):
+    '''Open a report file as text, decompressing it if it is compressed'''
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt')
+    if filename.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError(
+                'the zstandard module is needed to read {}'.format(filename))
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True))
+    return open(filename)
+
+
+def check_compression(compression):
+    '''
+    Raise ValueError if reports can't be written with compression, so that a
+    bad --compress is reported before any work is done
+    '''
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError('must be gzip or zstd')
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError('the zstandard module is needed for zstd')
+
+
+def write_report(filename, text, compression=None, sync=True):
+    '''
+    Atomically write a report to filename (which has no compression suffix)
+    plus the suffix for compression, and remove any copy of it with another
+    compression, which report_entries() might prefer. Returns the name of the
+    file written. sync=False skips flushing it to disk first, which is much
+    faster for throwaway reports (see synthetic_reports.py).
+    '''
+    others = [filename + suffix for c, suffix in COMPRESSION_SUFFIXES.items() if c != compression]
+    filename += COMPRESSION_SUFFIXES[compression]
+    tmp = filename + '.tmp'
+    if compression == 'gzip':
+        with gzip.open(tmp, 'wt', compresslevel=9) as f:
+            f.write(text)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('the zstandard module is needed to write zstd')
+        with open(tmp, 'wb') as f:
+            f.write(zstandard.ZstdCompressor(level=19).compress(text.encode('utf-8')))
+    else:
+        with open(tmp, 'w') as f:
+            f.write(text)
+    if sync:
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+    os.replace(tmp, filename)
+    for other in others:
+        if os.path.exists(other):
+            os.remove(other)
+    return filename
+
+
+def report_entries(reports_dir=REPORTS_DIR):
+    '''
+    (report_id, filename) for every report file, sorted by id. Reports may be
+    plain or compressed; if there is more than one file for a report, the
+    plain one wins.
+    '''
+    entries = {}
+    for suffix in COMPRESSION_SUFFIXES.values():
+        for f in glob.glob(os.path.join(reports_dir, '*' + suffix)):
+            report_id = os.path.basename(f)[:-len(suffix)]
+            if report_id.isdigit():
+                entries.setdefault(int(report_id), f)
+    return sorted(entries.items())
+
+
+def compress_reports(compression, reports_dir=REPORTS_DIR):
+    '''Convert every plain .json report to the given compression'''
+    plain = [f for report_id, f in report_entries(reports_dir)
+             if f.endswith('.json')]
+    for i, filename in enumerate(plain):
+        if (i % 1000 == 0):
+            print('Compressing record {} of {}'.format(i, len(plain)), end='\r')
+        with open_report(filename) as f:
+            text = f.read()
+        # This also removes the plain report.
+        write_report(filename[:-len('.json')], text, compression)
+    print('Compressed {} reports'.format(len(plain)))
+
+
+def file_key(filename):
+    '''What identifies a particular version of a report file'''
+    st = os.stat(filename)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _parse_chunk(args):
+    '''
+    Parse some reports, projected to fields (see json_project.py) and
+    normalized if asked. This is the unit of work handed to each worker
+    process when loading with more than one job. Also returns the seconds
+    spent reading, decoding and normalizing, for timing.
+    '''
+    reports_entries, fields, normalize = args
+    records = []
+    seconds = [0.0, 0.0, 0.0]
+    for report_id, filename in reports_entries:
+        report = None
+        start = time.perf_counter()
+        with open_report(filename) as f:
+            try:
+                text = f.read()
+                read = time.perf_counter()
+                seconds[0] += read - start
+                report = json_project.loads(text, fields)
+            except KeyboardInterrupt:
+                raise
+            except:
+                records.append((report_id, filename, None))
+                continue
+        decoded = time.perf_counter()
+        seconds[1] += decoded - read
+
+        if normalize:
+            report = normalize_report(report)
+            seconds[2] += time.perf_counter() - decoded
+        records.append((report_id, filename, report))
+    return records, seconds
+
+
+def _build_chunk(reports_entries):
+    '''
+    Parse some reports into a ReportStore of their own, which the parent
+    process adds to the whole store with ReportStore.extend(). This is the
+    unit of work handed to each worker process when building the store with
+    more than one job, so that the columns, bitsets and fingerprints of the
+    reports are made in the workers too. Also returns the filenames which
+    failed to parse, and the seconds spent reading, decoding, normalizing and
+    appending.
+    '''
+    records, seconds = _parse_chunk((reports_entries, REPORT_FIELDS, True))
+    start = time.perf_counter()
+    store = ReportStore()
+    failed = []
+    for report_id, filename, info in records:
+        if info is None:
+            failed.append(filename)
+        else:
+            store.append(report_id, info)
+    # Lookup tables the parent process doesn't need, which would only make the
+    # store slower to send to it
+    store._fingerprint_index = None
+    store.formats._index = None
+    store.formats._digests = {}
+    seconds.append(time.perf_counter() - start)
+    return store, failed, seconds
+
+
+def print_progress(i, total):
+    if (i % 1000 == 0):
+        print('Reading record {} of {} ({:.2f}%)'.format(i, total, (i / total) * 100), end='\r')
+
+
+def _map_chunks(function, chunks, jobs):
+    '''Yield function(chunk) for each chunk, in order, in `jobs` worker processes'''
+    if jobs > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap(function, chunks)
+    else:
+        pool = None
+        results = map(function, chunks)
+    try:
+        yield from results
+    except KeyboardInterrupt:
+        sys.exit(1)
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def read_reports(reports_entries, jobs=1, fields=REPORT_FIELDS, normalize=True,
+                 progress=print_progress):
+    '''
+    Yield (report_id, report) for each report that parses, in the order given.
+    By default report is as returned by normalize_report(); with normalize
+    False it is the report itself, projected to fields. progress(i, total) is
+    called after each report. With jobs > 1 the reports are parsed in a pool
+    of worker processes, but the results (and any errors printed) are exactly
+    the same as when parsing serially.
+    '''
+    chunks = [(reports_entries[i:i + CHUNK_SIZE], fields, normalize)
+              for i in range(0, len(reports_entries), CHUNK_SIZE)]
+    i = 0
+    for records, seconds in _map_chunks(_parse_chunk, chunks, jobs):
+        for name, s in zip(('read', 'decode', 'normalize'), seconds):
+            timing.add(name, s, len(records))
+        for report_id, filename, report in records:
+            i = i + 1
+            if progress:
+                progress(i, len(reports_entries))
+
+            if report is None:
+                print('error parsing {}'.format(filename))
+                continue
+            yield report_id, report
+
+
+def read_stores(reports_entries, jobs=1, progress=print_progress):
+    '''
+    Like read_reports(), but yield the reports which parse a chunk at a time,
+    as ReportStores built by the worker processes (see _build_chunk()).
+    '''
+    chunks = [reports_entries[i:i + CHUNK_SIZE]
+              for i in range(0, len(reports_entries), CHUNK_SIZE)]
+    i = 0
+    for store, failed, seconds in _map_chunks(_build_chunk, chunks, jobs):
+        n = len(store) + len(failed)
+        for name, s in zip(('read', 'decode', 'normalize', 'append'), seconds):
+            timing.add(name, s, n)
+        for _ in range(n):
+            i = i + 1
+            if progress:
+                progress(i, len(reports_entries))
+        for filename in failed:
+            print('error parsing {}'.format(filename))
+        yield store
+
+
+def parse(store, reports_entries, files, jobs=1, progress=print_progress):
+    '''
+    Parse the given reports and append them to the store, in order. With
+    jobs > 1, the worker processes also build the records of the reports,
+    which are only put together here.
+    '''
+    parsed = set()
+    if jobs > 1 and len(reports_entries) > CHUNK_SIZE:
+        extend = timing.timed(store.extend, 'extend')
+        for chunk in read_stores(reports_entries, jobs, progress):
+            parsed.update(chunk.ids)
+            extend(chunk)
+    else:
+        append = timing.timed(store.append, 'append')
+        for report_id, info in read_reports(reports_entries, jobs, progress=progress):
+            parsed.add(report_id)
+            append(report_id, info)
+    for report_id, _ in reports_entries:
+        store.files[report_id] = files[report_id]
+        if report_id not in parsed:
+            store.errors.append(report_id)
+
+
+def build(reports_entries, files, jobs=1, progress=print_progress):
+    store = ReportStore()
+    print('Building report store from {} records...'.format(len(reports_entries)))
+    parse(store, reports_entries, files, jobs, progress)
+    return store
+
+
+def merge(old, reports_entries, files, stale, jobs=1, progress=print_progress):
+    '''
+    Rebuild the store in report id order, only parsing the stale reports.
+    The new store starts out with the names, format profiles and capability
+    profiles of old, so that each run of the reports in old which haven't
+    changed can be copied a column at a time, rather than appended again one
+    by one. old can't be used afterwards.
+    '''
+    parsed = dict(read_reports([(report_id, filename) for report_id, filename in reports_entries
+                                if report_id in stale], jobs, progress=progress))
+    store = ReportStore()
+    for nameset, old_nameset in ((store.features, old.features), (store.extensions, old.extensions)):
+        nameset.names = list(old_nameset.names)
+        nameset.bits = dict(old_nameset.bits)
+    # The format matrix (which may be mapped) is shared, but not the profile
+    # of each report.
+    store.formats = copy.copy(old.formats)
+    store.formats.profile = array(old.formats.profile.typecode)
+    store.fingerprints = list(old.fingerprints)
+
+    old_rows = {report_id: i for i, report_id in enumerate(old.ids)}
+    # The run of rows of old to be copied next
+    start = stop = None
+    for report_id, filename in reports_entries:
+        store.files[report_id] = files[report_id]
+        i = old_rows.get(report_id)
+        if report_id not in parsed and i is not None and report_id not in stale:
+            if i != stop:
+                if start is not None:
+                    store._copy_rows(old, start, stop)
+                start = i
+            stop = i + 1
+            continue
+        if start is not None:
+            store._copy_rows(old, start, stop)
+            start = stop = None
+        if report_id in parsed:
+            store.append(report_id, parsed[report_id])
+        else:
+            store.errors.append(report_id)
+    if start is not None:
+        store._copy_rows(old, start, stop)
+    store._drop_unused_profiles()
+    return store
+
+
+def load_dates(dates_file=DATES_FILE):
+    '''Submission dates ('YYYY-MM-DD') by report id, if any have been saved'''
+    if not os.path.exists(dates_file):
+        return {}
+    with open(dates_file) as f:
+        return {int(report_id): date for report_id, date in json.load(f).items()}
+
+
+def save_dates(dates, dates_file=DATES_FILE):
+    os.makedirs(os.path.dirname(dates_file), exist_ok=True)
+    with open(dates_file + '.tmp', 'w') as f:
+        json.dump({str(report_id): date for report_id, date in sorted(dates.items())}, f)
+    os.replace(dates_file + '.tmp', dates_file)
+
+
+def date_ordinal(date):
+    '''A 'YYYY-MM-DD...' date as a date ordinal, or 0 if it can't be parsed'''
+    try:
+        return datetime.date.fromisoformat(date[:10]).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+def update_dates(store, dates_file=DATES_FILE):
+    '''
+    Bring store.dates up to date with the dates file. Returns whether anything
+    changed.
+    '''
+    key = file_key(dates_file) if os.path.exists(dates_file) else None
+    if key == store.dates_key and len(store.dates) == len(store.ids):
+        return False
+    dates = load_dates(dates_file)
+    store.dates = array('l', (date_ordinal(dates.get(report_id))
+                              for report_id in store.ids))
+    store.dates_key = key
+    store._estimated_dates = None
+    return True
+
+
+def matrix_filename(store_file):
+    '''
+    Where the format matrix of the store in store_file is saved (see
+    FormatTable). It is in the machine's byte order, like the rest of cache/.
+    '''
+    return os.path.splitext(store_file)[0] + '-formats.bin'
+
+
+def save(store, store_file=STORE_FILE):
+    os.makedirs(os.path.dirname(store_file), exist_ok=True)
+    store.formats.save(matrix_filename(store_file))
+    with open(store_file + '.tmp', 'wb') as f:
+        pickle.dump(store.state(), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(store_file + '.tmp', store_file)
+
+
+def load(reports_dir=REPORTS_DIR, store_file=STORE_FILE, jobs=1, dates_file=DATES_FILE,
+         progress=print_progress):
+    '''
+    Load the report store, first bringing it up to date with the report files
+    currently in reports_dir. Only reports which are new, or whose file size or
+    mtime has changed, are parsed, using `jobs` processes.
+    '''
+    if (reports_dir, store_file) in _held:
+        return _held[(reports_dir, store_file)]
+    with timing.stage('load'):
+        return _load(reports_dir, store_file, jobs, dates_file, progress)
+
+
+def _load(reports_dir, store_file, jobs, dates_file, progress):
+    with timing.stage('glob'):
+        reports_entries = report_entries(reports_dir)
+    with timing.stage('stat'):
+        files = {report_id: file_key(filename)
+                 for report_id, filename in reports_entries}
+
+    store = None
+    if os.path.exists(store_file):
+        with timing.stage('read store'):
+            with open(store_file, 'rb') as f:
+                state = pickle.load(f)
+            if state['version'] == STORE_VERSION:
+                store = ReportStore.from_state(state)
+                # Without its format matrix, the store has to be rebuilt.
+                if not store.formats.map(matrix_filename(store_file)):
+                    store = None
+
+    changed = False
+    if store is None:
+        with timing.stage('parse'):
+            store = build(reports_entries, files, jobs, progress)
+        changed = True
+    else:
+        stale = [(report_id, filename) for report_id, filename in reports_entries
+                 if store.files.get(report_id) != files[report_id]]
+        removed = store.files.keys() - files.keys()
+        if stale or removed:
+            print('Updating report store with {} new or changed records...'.format(len(stale)))
+            last_id = max(store.files.keys(), default=-1)
+            with timing.stage('parse'):
+                if not removed and all(report_id > last_id for report_id, _ in stale):
+                    # The common case after fetch-new-data.py: new reports only ever have
+                    # higher ids, so they can just be appended.
+                    parse(store, stale, files, jobs, progress)
+                else:
+                    store = merge(store, reports_entries, files,
+                                  set(report_id for report_id, _ in stale), jobs, progress)
+            changed = True
+    with timing.stage('dates'):
+        if update_dates(store, dates_file):
+            changed = True
+    if changed:
+        with timing.stage('save store'):
+            save(store, store_file)
+    store.reports_dir = reports_dir
+    return store
+
+
+def hold(reports_dir=REPORTS_DIR, store_file=STORE_FILE, jobs=1):
+    '''
+    Load the store and keep it in memory, so that later calls to load() in
+    this process return it without going back to disk. Calling it again
+    reloads the store from disk. See tune.py.
+    '''
+    _held.pop((reports_dir, store_file), None)
+    store = load(reports_dir, store_file, jobs)
+    _held[(reports_dir, store_file)] = store
+    return store
+
+
+def file_source(reports_dir, fields, jobs, progress):
+    '''Every report, parsed from its file each time'''
+    return read_reports(report_entries(reports_dir), jobs,
+                        REPORT_FIELDS if fields is None else fields, fields is None, progress)
+
+
+def store_source(reports_dir, fields, jobs, progress):
+    '''
+    Reports from the report store, which is brought up to date first. The
+    store only has normalized records, so projected fields come from the files.
+    '''
+    if fields is not None:
+        return file_source(reports_dir, fields, jobs, progress)
+    store = load(reports_dir, jobs=jobs, progress=progress)
+    return ((report_id, store.info(i)) for i, report_id in enumerate(store.ids))
+
+
+# Where reports() gets reports from, by name: functions taking (reports_dir,
+# fields, jobs, progress) and returning an iterator like reports() does
+SOURCES = {
+    'store': store_source,
+    'files': file_source,
+}
+
+
+def reports(source='store', fields=None, reports_dir=REPORTS_DIR, jobs=1,
+            progress=print_progress):
+    '''
+    Iterate over (report_id, report) for every report that parses, in report
+    id order. If fields is None, report is its normalized record (with
+    header, environment, limits, properties, features, extensions and fmts);
+    otherwise it is the report projected to fields (a json_project.py spec,
+    or {'*': True} for all of it). Reports are read from the given source (see
+    SOURCES), and parsed in `jobs` processes.
+    '''
+    return SOURCES[source](reports_dir, fields, jobs, progress)
+
+
+if __name__ == '__main__':
+    if not os.path.isdir(REPORTS_DIR):
+        print("Run this script from outside the data repository.")
+        sys.exit(1)
+
+    # --compress gzip|zstd: compress the plain .json reports in place first.
+    # Compressed reports can be read by everything, but note that this changes
+    # the files in the data repository.
+    jobs = 1
+    opts, args = getopt.getopt(sys.argv[1:], 'j:', ['jobs=', 'compress='])
+    for o, a in opts:
+        if o in ('-j', '--jobs'):
+            jobs = int(a)
+        elif o == '--compress':
+            try:
+                check_compression(a)
+            except ValueError as e:
+                print('--compress: {}'.format(e))
+                sys.exit(1)
+            compress_reports(a)
+
+    reports_entries = report_entries()
+    store = build(reports_entries, {report_id: file_key(filename)
+                                    for report_id, filename in reports_entries}, jobs)
+    update_dates(store)
+    save(store)
+    print('Saved {} reports to {}'.format(len(store), STORE_FILE))
@@ -0,0 +1,358 @@
+# Format this file with python3 -m autopep8 -i requirement_files.py
+
+# Requirements written as data rather than Python, for query.py --requirements.
+#
+# A requirement file is JSON, TOML (Python 3.11+, or with the tomli module) or
+# YAML (with the PyYAML module), going by its extension. It holds a list of
+# requirements, and optionally of scenarios:
+#
+#   {
+#     "requirements": [
+#       {"type": "feature", "feature": "robustBufferAccess"},
+#       {"type": "min_limit", "limit": "maxBoundDescriptorSets", "value": 4},
+#       {"name": "depth24plus", "type": "any_of", "of": [
+#         {"type": "format_features", "format": "X8_D24_UNORM_PACK32",
+#          "features": ["SAMPLED_IMAGE", "DEPTH_STENCIL_ATTACHMENT"]},
+#         ...]}
+#     ],
+#     "scenarios": [
+#       {"name": "Current"},
+#       {"name": "Bump", "requirements": [...]}
+#     ]
+#   }
+#
+# Each requirement is one of the TYPES below, with their parameters. "name"
+# overrides the name it is reported under, which otherwise follows the helpers
+# in query.py (e.g. "maxBoundDescriptorSets >= 4"), and "note" is ignored, for
+# comments in JSON. A scenario is every requirement query.py has, from all of
+# the files and query.py itself, plus its own.
+#
+# Enum values are given by name: "format" is a vk.Format, "features" are
+# vk.FormatFeature flags, and bits can be named like "SampleCount._4". Numbers
+# can also be written as strings, like "0x8086".
+#
+# Every type loads as one of the predicates in predicates.py, so it is
+# evaluated as a NumPy mask over all reports at once, and its results can be
+# cached (see result_cache.py). Requirements which need arbitrary code are
+# still added with add_rq() in query.py.
+#
+# Run this file with requirement files as arguments to check them and list the
+# requirements they contain.
+
+from collections import OrderedDict
+import datetime
+import hashlib
+import json
+import os
+import sys
+
+from predicates import (AllOf, AnyOf, ApiMajorVersion, ApiVariant, BitsLimit, Extension,
+                        Feature, FormatFeatures, LimitEquals, MaxLimit, MinApiVersion, MinLimit,
+                        MinOptProperty, SubmittedSince, VendorID)
+import vk_enums
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# The requirements query.py uses by default, which live with the scripts
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'requirements', 'default.json')
+
+
+class dotdict(dict):
+    '''dot.notation access to dictionary attributes'''
+    __getattr__ = dict.get
+    __setattr__ = dict.__setitem__
+    __delattr__ = dict.__delitem__
+
+
+class _Spec:
+    '''The parameters of one requirement, each of which must be used once'''
+
+    def __init__(self, spec, where):
+        if not isinstance(spec, dict):
+            raise ValueError('{}: expected a table, got {!r}'.format(where, spec))
+        self.spec = dict(spec)
+        self.where = where
+        self.spec.pop('note', None)
+
+    def error(self, message):
+        return ValueError('{}: {}'.format(self.where, message))
+
+    def take(self, key, *default):
+        if key in self.spec:
+            return self.spec.pop(key)
+        if default:
+            return default[0]
+        raise self.error('missing "{}"'.format(key))
+
+    def done(self):
+        if self.spec:
+            raise self.error('unknown parameter(s) {}'.format(', '.join(sorted(self.spec))))
+
+
+def _number(spec, value):
+    if type(value) == str:
+        try:
+            return int(value, 0)
+        except ValueError:
+            raise spec.error('not a number: {!r}'.format(value))
+    if type(value) not in (int, float):
+        raise spec.error('not a number: {!r}'.format(value))
+    return value
+
+
+def _enum(spec, vk, enum, value):
+    '''A value of vk.<enum>, by name (or qualified name, like SampleCount._4)'''
+    if type(value) != str:
+        return _number(spec, value)
+    if '.' in value:
+        enum, value = value.split('.', 1)
+    if enum is None or vk.get(enum) is None or vk[enum].get(value) is None:
+        raise spec.error('unknown enum value {!r}'.format(
+            value if enum is None else '{}.{}'.format(enum, value)))
+    return vk[enum][value]
+
+
+def _flags(spec, vk, enum, value):
+    '''Flags, as a number, a name, or a list of names to combine'''
+    if type(value) != list:
+        return _enum(spec, vk, enum, value)
+    result = 0
+    for v in value:
+        result |= _enum(spec, vk, enum, v)
+    return result
+
+
+def _describe_value(value):
+    if type(value) == list:
+        return '[{}]'.format(','.join(str(v) for v in value))
+    return str(value)
+
+
+def _limit(cls, op):
+    def load(spec, vk):
+        name = spec.take('limit')
+        index = spec.take('index', None)
+        value = spec.take('value')
+        value = [_number(spec, v) for v in value] if type(value) == list else _number(spec, value)
+        limit = name if index is None else '{}[{}]'.format(name, index)
+        return cls(name, value, index=index), '{} {} {}'.format(limit, op, _describe_value(value))
+    return load
+
+
+def _bits_limit(spec, vk):
+    name = spec.take('limit')
+    bits = _flags(spec, vk, None, spec.take('bits'))
+    return BitsLimit(name, bits), '{} has bits 0b{:b}'.format(name, bits)
+
+
+def _min_opt_property(spec, vk):
+    name = spec.take('property')
+    value = _number(spec, spec.take('value'))
+    return MinOptProperty(name, value), '{} >= {}'.format(name, value)
+
+
+def _feature(spec, vk):
+    name = spec.take('feature')
+    return Feature(name), name
+
+
+def _extension(spec, vk):
+    name = spec.take('extension')
+    return Extension(name), name
+
+
+def _api_variant(spec, vk):
+    variant = _number(spec, spec.take('variant'))
+    return ApiVariant(variant), 'API version variant is {}'.format(variant)
+
+
+def _api_major_version(spec, vk):
+    major = _number(spec, spec.take('major'))
+    return ApiMajorVersion(major), 'API version is {}.x.x'.format(major)
+
+
+def _min_api_version(spec, vk):
+    version = spec.take('version')
+    if type(version) == str:
+        version = version.split('.')
+    version = [_number(spec, v) for v in version]
+    if len(version) == 2:
+        version.append(0)
+    if len(version) != 3:
+        raise spec.error('version must be major.minor[.patch]')
+    name = 'Vulkan {}.{}'.format(*version) + ('.{}'.format(version[2]) if version[2] else '')
+    return MinApiVersion(version), name
+
+
+def _vendor_id(spec, vk):
+    vendors = spec.take('vendors')
+    vendors = [_number(spec, v) for v in (vendors if type(vendors) == list else [vendors])]
+    return VendorID(vendors), 'vendorID is {}'.format('/'.join('0x{:x}'.format(v) for v in vendors))
+
+
+def _format_features(spec, vk):
+    format = spec.take('format')
+    features = spec.take('features')
+    tiling = spec.take('tiling', 'optimal')
+    if tiling not in ('optimal', 'linear'):
+        raise spec.error('tiling must be optimal or linear')
+    names = features if type(features) == list else [features]
+    name = '{} has {}{}'.format(format, '|'.join(str(f) for f in names),
+                                ' (linear tiling)' if tiling == 'linear' else '')
+    return FormatFeatures(_enum(spec, vk, 'Format', format),
+                          _flags(spec, vk, 'FormatFeature', features), tiling), name
+
+
+def _submitted_since(spec, vk):
+    date = spec.take('date')
+    if type(date) == str:
+        try:
+            date = datetime.date.fromisoformat(date)
+        except ValueError:
+            raise spec.error('date must be YYYY-MM-DD')
+    return SubmittedSince(date), 'submitted since {}'.format(date)
+
+
+def _combination(cls, separator):
+    def load(spec, vk):
+        of = spec.take('of')
+        if type(of) != list or not of:
+            raise spec.error('"of" must be a list of requirements')
+        loaded = [_predicate(_Spec(p, '{}, of[{}]'.format(spec.where, j)), vk)
+                  for j, p in enumerate(of)]
+        names = ['({})'.format(name) if isinstance(p, (AnyOf, AllOf)) else name
+                 for p, name in loaded]
+        return cls(*(p for p, _ in loaded)), separator.join(names)
+    return load
+
+
+# Functions loading each type of requirement, returning the predicate and the
+# name it is reported under by default
+TYPES = {
+    'min_limit': _limit(MinLimit, '>='),
+    'max_limit': _limit(MaxLimit, '<='),
+    'limit_equals': _limit(LimitEquals, '=='),
+    'bits_limit': _bits_limit,
+    'min_opt_property': _min_opt_property,
+    'feature': _feature,
+    'extension': _extension,
+    'api_variant': _api_variant,
+    'api_major_version': _api_major_version,
+    'min_api_version': _min_api_version,
+    'vendor_id': _vendor_id,
+    'format_features': _format_features,
+    'submitted_since': _submitted_since,
+    'any_of': _combination(AnyOf, ' or '),
+    'all_of': _combination(AllOf, ' and '),
+}
+
+
+def _predicate(spec, vk):
+    kind = spec.take('type')
+    if kind not in TYPES:
+        raise spec.error('unknown type {!r}'.format(kind))
+    result = TYPES[kind](spec, vk)
+    spec.done()
+    return result
+
+
+def _requirements(specs, vk, where):
+    if type(specs) != list:
+        raise ValueError('{}: expected a list of requirements'.format(where))
+    result = []
+    for j, spec in enumerate(specs):
+        spec = _Spec(spec, '{}[{}]'.format(where, j))
+        name = spec.take('name', None)
+        passes, default_name = _predicate(spec, vk)
+        result.append((name or default_name, passes))
+    return result
+
+
+def parse(text, filename):
+    '''The contents of a requirement file, by its extension'''
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.json':
+        return json.loads(text)
+    if ext == '.toml':
+        if tomllib is None:
+            raise ValueError('{}: reading TOML needs Python 3.11 or the tomli module'.format(filename))
+        return tomllib.loads(text)
+    if ext in ('.yaml', '.yml'):
+        if yaml is None:
+            raise ValueError('{}: reading YAML needs the PyYAML module'.format(filename))
+        try:
+            return yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(str(e))
+    raise ValueError('{}: requirement files must be .json, .toml or .yaml'.format(filename))
+
+
+def load(filename, vk=None):
+    '''
+    Load a requirement file, as a dotdict with a list of (name, predicate)
+    requirements, and the extra requirements of each scenario by name.
+    Raises ValueError (or OSError) if it can't be read.
+    '''
+    if vk is None:
+        vk = vk_enums.load()
+    with open(filename) as f:
+        text = f.read()
+    try:
+        contents = parse(text, filename)
+    except ValueError as e:
+        if str(e).startswith(filename):
+            raise
+        raise ValueError('{}: {}'.format(filename, e))
+    if type(contents) == list:
+        contents = {'requirements': contents}
+    if type(contents) != dict:
+        raise ValueError('{}: expected a table of requirements'.format(filename))
+    unknown = set(contents) - {'requirements', 'scenarios', 'note'}
+    if unknown:
+        raise ValueError('{}: unknown section(s) {}'.format(filename, ', '.join(sorted(unknown))))
+
+    result = dotdict({'requirements': _requirements(contents.get('requirements', []), vk,
+                                                    filename + ': requirements'),
+                      'scenarios': OrderedDict()})
+    scenarios = contents.get('scenarios', [])
+    if type(scenarios) != list:
+        raise ValueError('{}: expected a list of scenarios'.format(filename))
+    for j, scenario in enumerate(scenarios):
+        spec = _Spec(scenario, '{}: scenarios[{}]'.format(filename, j))
+        name = spec.take('name')
+        extra = _requirements(spec.take('requirements', []), vk,
+                              '{}: scenarios[{}].requirements'.format(filename, j))
+        spec.done()
+        result.scenarios[name] = extra
+    return result
+
+
+if __name__ == '__main__':
+    vk = vk_enums.load()
+    for filename in sys.argv[1:] or [DEFAULT_FILE]:
+        try:
+            loaded = load(filename, vk)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        print('{}: {} requirements, {} scenarios'.format(
+            filename, len(loaded.requirements), len(loaded.scenarios)))
+        # The hash identifies the predicate in the result cache.
+        for name, passes in loaded.requirements:
+            print('  {}  cost {}  {}'.format(
+                hashlib.blake2b(passes.fingerprint().encode(), digest_size=6).hexdigest()
+                if passes.fingerprint() else '-' * 12, passes.cost, name))
+        for scenario, extra in loaded.scenarios.items():
+            print('  scenario "{}": {}'.format(scenario, ', '.join(name for name, _ in extra) or
+                                               'no extra requirements'))
@@ -0,0 +1,156 @@
+# Format this file with python3 -m autopep8 -i result_cache.py
+
+# Remembers which capability profiles (see ReportStore.capability) pass each
+# requirement, so that running query.py again only evaluates the requirements
+# which are new or have changed, and for the others only the profiles of new
+# reports.
+#
+# Requirements are identified by Predicate.fingerprint(), i.e. by their class
+# and parameters (so renaming one doesn't invalidate it), and profiles by their
+# fingerprint, so the cache stays valid as reports are added or removed.
+# Lambdas, and predicates which depend on more than the capability profile
+# (like SubmittedSince), aren't cached.
+#
+# The cache is kept in cache/query-results.pickle. When it gets bigger than
+# MAX_BYTES, the requirements used least recently are dropped from it.
+
+import os
+import pickle
+
+from predicates import _as_predicate
+import report_store
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CACHE_FILE = os.path.join('cache', 'query-results.pickle')
+# Bump this when a predicate's meaning changes
+CACHE_VERSION = 2
+MAX_BYTES = 16 << 20
+
+
+def _unpack(bits, n):
+    '''The first n bits of a bytearray bitset, as a list (or array) of 0/1'''
+    # Profiles added since the bitset was saved are unknown.
+    bits = bytes(bits) + bytes(max(0, (n + 7) // 8 - len(bits)))
+    if numpy is not None:
+        return numpy.unpackbits(numpy.frombuffer(bits, dtype=numpy.uint8),
+                                count=n, bitorder='little')
+    return [bits[j >> 3] >> (j & 7) & 1 for j in range(n)]
+
+
+def _pack(values):
+    '''A bytearray bitset of a list (or array) of 0/1'''
+    if numpy is not None:
+        return bytearray(numpy.packbits(numpy.asarray(values, dtype=bool), bitorder='little').tobytes())
+    bits = bytearray((len(values) + 7) // 8)
+    for j, v in enumerate(values):
+        if v:
+            bits[j >> 3] |= 1 << (j & 7)
+    return bits
+
+
+class ResultCache:
+    def __init__(self, store, cache_file=CACHE_FILE, max_bytes=MAX_BYTES):
+        self.store = store
+        self.cache_file = cache_file
+        self.max_bytes = max_bytes
+        # Fingerprints of the profiles which the bitsets refer to
+        self.profiles = []
+        # [known bitset, passes bitset, last use] by requirement fingerprint
+        self.entries = {}
+        self.uses = 0
+        # Where each of the store's profiles is in self.profiles; None until
+        # the cache file is loaded, which is only done once a predicate is
+        # looked up in it (with NumPy, most requirements never are).
+        self.index = None
+        self.changed = False
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'rb') as f:
+                state = pickle.load(f)
+            if (state['version'], state['store_version']) == (CACHE_VERSION, report_store.STORE_VERSION):
+                self.profiles = state['profiles']
+                self.entries = state['entries']
+                self.uses = state['uses']
+        except KeyboardInterrupt:
+            raise
+        except:
+            pass
+
+        index = {f: j for j, f in enumerate(self.profiles)}
+        self.index = []
+        for f in self.store.fingerprints:
+            if f not in index:
+                index[f] = len(self.profiles)
+                self.profiles.append(f)
+            self.index.append(index[f])
+
+    def passes(self, predicate, evaluate):
+        '''
+        Whether each of the store's profiles passes predicate, as a list (or
+        an array, with NumPy). The profiles the cache doesn't know about yet
+        are evaluated by calling evaluate() with a list of their indices,
+        which returns a list of bools. None if the predicate can't be cached.
+        '''
+        key = _as_predicate(predicate).fingerprint()
+        if key is None:
+            return None
+        if self.index is None:
+            self._load()
+        n = len(self.profiles)
+        if key in self.entries:
+            known, passed, _ = self.entries[key]
+            known, passed = _unpack(known, n), _unpack(passed, n)
+        else:
+            known, passed = _unpack(b'', n), _unpack(b'', n)
+        self.uses += 1
+
+        if numpy is not None:
+            index = numpy.array(self.index, dtype=numpy.int64)
+            missing = numpy.flatnonzero(known[index] == 0).tolist()
+        else:
+            missing = [c for c, j in enumerate(self.index) if not known[j]]
+        for c, p in zip(missing, evaluate(missing) if missing else []):
+            known[self.index[c]] = 1
+            passed[self.index[c]] = 1 if p else 0
+        self.changed = True
+        self.entries[key] = [_pack(known), _pack(passed), self.uses]
+        if numpy is not None:
+            return passed[index] == 1
+        return [passed[j] == 1 for j in self.index]
+
+    def size(self):
+        '''Roughly how many bytes the cache takes up'''
+        return (sum(len(f) for f in self.profiles) +
+                sum(len(known) + len(passed) for known, passed, _ in self.entries.values()))
+
+    def _compact(self):
+        '''Forget the profiles which aren't in the store any more'''
+        current = sorted(set(self.index))
+        n = len(self.profiles)
+        for key, (known, passed, used) in self.entries.items():
+            known, passed = _unpack(known, n), _unpack(passed, n)
+            self.entries[key] = [_pack([known[j] for j in current]),
+                                 _pack([passed[j] for j in current]), used]
+        new_index = {j: k for k, j in enumerate(current)}
+        self.profiles = [self.profiles[j] for j in current]
+        self.index = [new_index[j] for j in self.index]
+
+    def save(self):
+        if not self.changed:
+            return
+        if len(self.profiles) > 2 * len(set(self.index)):
+            self._compact()
+        while self.entries and self.size() > self.max_bytes:
+            del self.entries[min(self.entries, key=lambda key: self.entries[key][2])]
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        with open(self.cache_file + '.tmp', 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'store_version': report_store.STORE_VERSION,
+                         'profiles': self.profiles, 'entries': self.entries, 'uses': self.uses},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.cache_file + '.tmp', self.cache_file)
+        self.changed = False
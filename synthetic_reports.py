@@ -0,0 +1,299 @@
+#!/usr/bin/python3
+# Format this file with python3 -m autopep8 -i synthetic_reports.py
+
+# Generates synthetic reports, for benchmark.py and for trying things out when
+# the data repository isn't checked out.
+#
+#   python3 synthetic_reports.py [--seed S] [--sample FILE] [--compress gzip|zstd] N DIR
+#
+# writes N reports to DIR/1.json ... DIR/N.json. They are made by varying the
+# structure of a sample report (data/sample-report-10954.json if it is there,
+# otherwise a small built-in one). First a pool of devices is derived from it,
+# each with its own identity, limits, features, extensions and formats, with
+# mobile devices tending to have lower limits and different texture
+# compression. Then each report is one of those devices with some driver
+# version and OS, and now and then a driver which reports a limit
+# differently. As in the real data, a few devices account for most of the
+# reports. The same seed always gives the same reports.
+
+import getopt
+import json
+import os
+import random
+import sys
+
+import report_store
+
+SAMPLE_REPORT = os.path.join('data', 'sample-report-10954.json')
+
+# (vendorID, deviceName format, first deviceID, mobile)
+VENDORS = [
+    (0x10de, 'NVIDIA GeForce RTX {}', 0x2200, False),
+    (0x10de, 'NVIDIA GeForce GTX {}', 0x1b00, False),
+    (0x1002, 'AMD Radeon RX {} (RADV NAVI2X)', 0x7300, False),
+    (0x1002, 'AMD Radeon(TM) Graphics {}', 0x1600, False),
+    (0x8086, 'Intel(R) UHD Graphics {}', 0x9b00, False),
+    (0x8086, 'Intel(R) Xe Graphics {}', 0x4600, False),
+    (0x10005, 'llvmpipe (LLVM {}.0.0, 256 bits)', 0x0000, False),
+    (0x106b, 'Apple M{}', 0x0000, False),
+    (0x13b5, 'Mali-G{} MC4', 0x9000, True),
+    (0x5143, 'Adreno (TM) {}', 0x6000, True),
+    (0x1010, 'PowerVR Rogue GE{}', 0x2200, True),
+    (0x14e4, 'V3D {}', 0x0000, True),
+]
+
+OS_VERSIONS = {
+    'windows': ['10.0.19045', '10.0.22621', '10.0.22631'],
+    'linux': ['5.15', '6.1', '6.5', '6.8'],
+    'android': ['10', '11', '12', '13', '14'],
+    'macos': ['13.6', '14.2'],
+}
+
+# A small report with the same structure as the real ones, for when the
+# sample report isn't there
+BUILTIN_SAMPLE = {
+    'environment': {'name': 'windows', 'version': '10.0.19045', 'architecture': 'x86_64',
+                    'submitter': '', 'comment': '', 'reportversion': '3.32'},
+    'properties': {
+        'apiVersion': 4206847, 'deviceID': 0x2484, 'deviceName': 'NVIDIA GeForce RTX 3070',
+        'deviceType': 2, 'driverVersion': 2252406784, 'vendorID': 0x10de,
+        'pipelineCacheUUID': [16, 59, 99, 193, 136, 89, 169, 146, 38, 238, 226, 109, 108, 29, 174, 76],
+        'limits': {
+            'maxImageDimension1D': 32768, 'maxImageDimension2D': 32768, 'maxImageDimension3D': 16384,
+            'maxImageDimensionCube': 32768, 'maxImageArrayLayers': 2048,
+            'maxTexelBufferElements': 134217728, 'maxUniformBufferRange': 65536,
+            'maxStorageBufferRange': 4294967295, 'maxPushConstantsSize': 256,
+            'maxMemoryAllocationCount': 4096, 'maxSamplerAllocationCount': 4000,
+            'bufferImageGranularity': 1024, 'maxBoundDescriptorSets': 32,
+            'maxPerStageDescriptorSamplers': 1048576, 'maxPerStageDescriptorUniformBuffers': 15,
+            'maxPerStageDescriptorStorageBuffers': 1048576,
+            'maxPerStageDescriptorSampledImages': 1048576,
+            'maxPerStageDescriptorStorageImages': 1048576,
+            'maxPerStageDescriptorInputAttachments': 1048576, 'maxPerStageResources': 4294967295,
+            'maxDescriptorSetSamplers': 1048576, 'maxDescriptorSetUniformBuffers': 90,
+            'maxDescriptorSetUniformBuffersDynamic': 15, 'maxDescriptorSetStorageBuffers': 1048576,
+            'maxDescriptorSetStorageBuffersDynamic': 16, 'maxDescriptorSetSampledImages': 1048576,
+            'maxDescriptorSetStorageImages': 1048576, 'maxDescriptorSetInputAttachments': 1048576,
+            'maxVertexInputAttributes': 32, 'maxVertexInputBindings': 32,
+            'maxVertexInputAttributeOffset': 2047, 'maxVertexInputBindingStride': 2048,
+            'maxVertexOutputComponents': 128, 'maxFragmentInputComponents': 128,
+            'maxFragmentOutputAttachments': 8, 'maxFragmentDualSrcAttachments': 1,
+            'maxFragmentCombinedOutputResources': 4294967295,
+            'maxComputeSharedMemorySize': 49152,
+            'maxComputeWorkGroupCount': [2147483647, 65535, 65535],
+            'maxComputeWorkGroupInvocations': 1024, 'maxComputeWorkGroupSize': [1024, 1024, 64],
+            'subPixelPrecisionBits': 8, 'maxDrawIndexedIndexValue': 4294967295,
+            'maxDrawIndirectCount': 4294967295, 'maxSamplerLodBias': 15.0,
+            'maxSamplerAnisotropy': 16.0, 'maxViewports': 16,
+            'maxViewportDimensions': [32768, 32768], 'viewportBoundsRange': [-65536.0, 65536.0],
+            'minMemoryMapAlignment': 64, 'minTexelBufferOffsetAlignment': 16,
+            'minUniformBufferOffsetAlignment': 64, 'minStorageBufferOffsetAlignment': 16,
+            'maxFramebufferWidth': 32768, 'maxFramebufferHeight': 32768, 'maxFramebufferLayers': 2048,
+            'framebufferColorSampleCounts': 15, 'framebufferDepthSampleCounts': 15,
+            'framebufferStencilSampleCounts': 31, 'framebufferNoAttachmentsSampleCounts': 31,
+            'maxColorAttachments': 8, 'sampledImageColorSampleCounts': 15,
+            'sampledImageDepthSampleCounts': 15, 'storageImageSampleCounts': 15,
+            'timestampPeriod': 1.0, 'maxClipDistances': 8, 'standardSampleLocations': 1,
+            'strictLines': 1, 'nonCoherentAtomSize': 64,
+        },
+        'sparseProperties': {'residencyStandard2DBlockShape': 1, 'residencyNonResidentStrict': 1},
+    },
+    'features': {name: 1 for name in [
+        'robustBufferAccess', 'fullDrawIndexUint32', 'imageCubeArray', 'independentBlend',
+        'geometryShader', 'tessellationShader', 'sampleRateShading', 'dualSrcBlend', 'logicOp',
+        'multiDrawIndirect', 'depthClamp', 'depthBiasClamp', 'fillModeNonSolid', 'wideLines',
+        'largePoints', 'samplerAnisotropy', 'textureCompressionBC', 'occlusionQueryPrecise',
+        'fragmentStoresAndAtomics', 'shaderFloat64', 'shaderInt64', 'shaderInt16']},
+    'extensions': [{'extensionName': name, 'specVersion': 1} for name in [
+        'VK_KHR_swapchain', 'VK_KHR_maintenance1', 'VK_KHR_maintenance2', 'VK_KHR_maintenance3',
+        'VK_KHR_16bit_storage', 'VK_KHR_8bit_storage', 'VK_KHR_dynamic_rendering',
+        'VK_EXT_robustness2', 'VK_EXT_descriptor_indexing', 'VK_KHR_timeline_semaphore']],
+    'formats': [[fmt, {'format': fmt, 'linearTilingFeatures': linear,
+                       'optimalTilingFeatures': optimal, 'bufferFeatures': buffer, 'supported': 1}]
+                for fmt, linear, optimal, buffer in [
+                    (37, 0x1d4c3, 0x1dd83, 0x58), (43, 0x1d401, 0x1dd81, 0x58),
+                    (44, 0x1d4c3, 0x1dd83, 0x58), (50, 0x1d401, 0x1dd81, 0x58),
+                    (97, 0x1d4c3, 0x1dd83, 0x7f), (100, 0x1d4c3, 0x1dd83, 0x7f),
+                    (109, 0x1d4c3, 0x1dd83, 0x7f), (124, 0x0, 0x1ee01, 0x0),
+                    (126, 0x0, 0x1ee01, 0x0), (127, 0x0, 0x1ee01, 0x0), (129, 0x0, 0x1ee01, 0x0),
+                    (130, 0x0, 0x1ee01, 0x0), (131, 0x1d401, 0x1d401, 0x0),
+                    (147, 0x1d401, 0x1d401, 0x0), (157, 0x1d401, 0x1d401, 0x0)]],
+    'core11': {'features': {'storageBuffer16BitAccess': 1, 'multiview': 1, 'shaderDrawParameters': 1},
+               'properties': {'maxMemoryAllocationSize': '4292870144', 'subgroupSize': '32',
+                              'maxPerSetDescriptors': '4294967295', 'protectedNoFault': 'false'}},
+    'core12': {'features': {'shaderInt8': 1, 'timelineSemaphore': 1, 'descriptorIndexing': 1},
+               'properties': {'driverName': 'NVIDIA', 'maxTimelineSemaphoreValueDifference': '18446744073709551615',
+                              'filterMinmaxSingleComponentFormats': 'true'}},
+    'extended': {
+        'devicefeatures2': [{'name': 'robustBufferAccess2', 'supported': True, 'extension': 'VK_EXT_robustness2'},
+                            {'name': 'nullDescriptor', 'supported': True, 'extension': 'VK_EXT_robustness2'}],
+        'deviceproperties2': [{'name': 'maxBufferSize', 'value': '18446744073709551615', 'extension': 'VK_KHR_maintenance4'}],
+    },
+    'memory': {'memoryHeaps': [{'size': 8589934592, 'flags': 1}, {'size': 25769803776, 'flags': 0}],
+               'memoryTypes': [{'heapIndex': i % 2, 'propertyFlags': [1, 6, 7][i % 3]} for i in range(8)]},
+    'queues': [{'queueCount': 16, 'queueFlags': 15, 'timestampValidBits': 64,
+                'minImageTransferGranularity': {'width': 1, 'height': 1, 'depth': 1}},
+               {'queueCount': 2, 'queueFlags': 12, 'timestampValidBits': 64,
+                'minImageTransferGranularity': {'width': 1, 'height': 1, 'depth': 1}}],
+}
+
+
+def load_sample(filename=SAMPLE_REPORT):
+    '''The sample report, or the built-in one if it isn't there'''
+    if not os.path.exists(filename):
+        return BUILTIN_SAMPLE
+    with report_store.open_report(filename) as f:
+        return json.load(f)
+
+
+def _scale(value, factor):
+    '''Scale a limit by a power of two, keeping its type'''
+    if type(value) == list:
+        return [_scale(v, factor) for v in value]
+    if type(value) == int and value > 1:
+        return max(1, int(value * factor))
+    if type(value) == float and value > 1:
+        return value * factor
+    return value
+
+
+def vary_limits(rng, limits, mobile):
+    '''
+    Lower some limits (and raise the alignments), by more on mobile devices.
+    Sample count masks lose some counts.
+    '''
+    limits = dict(limits)
+    for name, value in limits.items():
+        if name.endswith('SampleCounts'):
+            if rng.random() < (0.3 if mobile else 0.05):
+                limits[name] = value & rng.choice([0x5, 0x7, 0xd, 0xf])
+        elif rng.random() < (0.2 if mobile else 0.02):
+            factor = 2.0 ** -rng.randint(1, 3 if mobile else 1)
+            if name.startswith('min') and 'Alignment' in name:
+                factor = 1 / factor
+            limits[name] = _scale(value, factor)
+    return limits
+
+
+def make_device(rng, sample, k):
+    '''
+    A device derived from the sample report: (the device as a report, whether
+    it is mobile, the driver versions it has reports from)
+    '''
+    vendorID, name_format, first_deviceID, mobile = rng.choice(VENDORS)
+    device = dict(sample)
+
+    properties = dict(sample['properties'])
+    properties['vendorID'] = vendorID
+    properties['deviceID'] = first_deviceID + k if first_deviceID else 0
+    properties['deviceName'] = name_format.format(10 * k + rng.randint(0, 9))
+    properties['deviceType'] = 1 if mobile else rng.choice([1, 2, 2, 2])
+    minor = rng.choice([0, 1, 1, 2, 3, 3, 3])
+    properties['apiVersion'] = (1 << 22) | (minor << 12) | rng.randint(0, 280)
+    properties['limits'] = vary_limits(rng, sample['properties']['limits'], mobile)
+    device['properties'] = properties
+
+    features = {}
+    for name, value in sample['features'].items():
+        if name == 'textureCompressionBC':
+            value = not mobile
+        elif name.startswith('textureCompressionETC2') or name.startswith('textureCompressionASTC'):
+            value = mobile
+        elif rng.random() < (0.2 if mobile else 0.05):
+            value = not value
+        features[name] = 1 if value else 0
+    if mobile:
+        features['textureCompressionETC2'] = 1
+        features['textureCompressionASTC_LDR'] = 1
+    device['features'] = features
+
+    device['extensions'] = [e for e in sample['extensions']
+                            if rng.random() < (0.6 if mobile else 0.9)]
+
+    formats = []
+    for entry in sample['formats']:
+        if rng.random() < (0.1 if mobile else 0.02):
+            continue
+        fmt, flags = entry
+        if rng.random() < (0.2 if mobile else 0.05):
+            flags = dict(flags)
+            # Lose e.g. storage, blending or linear filtering
+            flags['optimalTilingFeatures'] = int(
+                flags['optimalTilingFeatures']) & ~rng.choice([0x2, 0x80, 0x1000])
+        formats.append([fmt, flags])
+    device['formats'] = formats
+
+    if 'extended' in sample and 'devicefeatures2' in sample['extended']:
+        extended = dict(sample['extended'])
+        extended['devicefeatures2'] = [
+            dict(v, supported=v['supported'] if rng.random() > 0.2 else not v['supported'])
+            for v in sample['extended']['devicefeatures2']]
+        device['extended'] = extended
+    drivers = [rng.randint(0, 1 << 31) for _ in range(rng.randint(1, 6))]
+    return device, mobile, drivers
+
+
+def make_report(rng, device, mobile, drivers, environment):
+    '''One report of a device, with one of its drivers and some OS'''
+    report = dict(device)
+    properties = dict(device['properties'])
+    properties['driverVersion'] = rng.choice(drivers)
+    if rng.random() < 0.05:
+        # A driver which reports a limit differently
+        limits = dict(properties['limits'])
+        name = rng.choice(sorted(limits))
+        limits[name] = _scale(limits[name], 0.5)
+        properties['limits'] = limits
+    report['properties'] = properties
+
+    os_name = 'android' if mobile else rng.choice(['windows', 'windows', 'linux', 'macos'])
+    report['environment'] = dict(environment, name=os_name,
+                                 version=rng.choice(OS_VERSIONS[os_name]),
+                                 submitter=rng.choice(['', '', 'someone']))
+    return report
+
+
+def generate(n, reports_dir, seed=1, sample=None, compression=None):
+    '''Write reports 1 to n to reports_dir'''
+    rng = random.Random(seed)
+    if sample is None:
+        sample = load_sample()
+    os.makedirs(reports_dir, exist_ok=True)
+
+    devices = [make_device(rng, sample, k)
+               for k in range(max(1, min(n, 20 + n // 25)))]
+    # A few devices have most of the reports
+    weights = [1 / (rank + 1) for rank in range(len(devices))]
+    environment = sample.get('environment', {})
+    for report_id in range(1, n + 1):
+        if (report_id % 1000 == 0):
+            print('Generating record {} of {}'.format(report_id, n), end='\r')
+        device, mobile, drivers = rng.choices(devices, weights)[0]
+        report = make_report(rng, device, mobile, drivers, environment)
+        report_store.write_report(os.path.join(reports_dir, str(report_id)),
+                                  json.dumps(report), compression, sync=False)
+    print('Generated {} reports of {} devices in {}'.format(n, len(devices), reports_dir))
+
+
+if __name__ == '__main__':
+    seed = 1
+    sample_file = SAMPLE_REPORT
+    compression = None
+    opts, args = getopt.getopt(sys.argv[1:], '', ['seed=', 'sample=', 'compress='])
+    for o, a in opts:
+        if o == '--seed':
+            seed = int(a)
+        elif o == '--sample':
+            sample_file = a
+        elif o == '--compress':
+            try:
+                report_store.check_compression(a)
+            except ValueError as e:
+                print('--compress: {}'.format(e))
+                sys.exit(1)
+            compression = a
+    if len(args) != 2:
+        print('Usage: synthetic_reports.py [--seed S] [--sample FILE] [--compress gzip|zstd] N DIR')
+        sys.exit(1)
+
+    generate(int(args[0]), args[1], seed, load_sample(sample_file), compression)
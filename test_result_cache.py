@@ -0,0 +1,89 @@
+# Format this file with python3 -m autopep8 -i test_result_cache.py
+
+# Run with python3 -m unittest test_result_cache
+
+from collections import namedtuple
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import predicates
+import report_store
+import result_cache
+
+# Made up VkFormat and flag values; only their differences matter here
+FORMAT_A = 10
+FORMAT_B = 20
+SAMPLED = 0x1
+
+Rq = namedtuple('Rq', ['name', 'passes'])
+
+
+def make_report(formats):
+    '''A minimal report, the same for every device except for its formats'''
+    return {
+        'properties': {'apiVersion': 4206847, 'deviceName': 'Test GPU', 'vendorID': 0x10de,
+                       'limits': {'maxBoundDescriptorSets': 8}},
+        'environment': {'name': 'linux'},
+        'features': {},
+        'extensions': [],
+        'formats': [[fmt, {'format': fmt, 'optimalTilingFeatures': flags,
+                           'linearTilingFeatures': 0, 'bufferFeatures': 0}]
+                    for fmt, flags in formats],
+    }
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.reports_dir = os.path.join(self.directory, 'reports')
+        self.store_file = os.path.join(self.directory, 'cache', 'report-store.pickle')
+        self.cache_file = os.path.join(self.directory, 'cache', 'query-results.pickle')
+        self.dates_file = os.path.join(self.directory, 'cache', 'report-dates.json')
+        os.makedirs(self.reports_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_report(self, report_id, formats):
+        with open(os.path.join(self.reports_dir, '{}.json'.format(report_id)), 'w') as f:
+            json.dump(make_report(formats), f)
+
+    def passes(self, requirement):
+        '''
+        Whether each report passes requirement, through the result cache, and
+        evaluated directly
+        '''
+        store = report_store.load(self.reports_dir, self.store_file, dates_file=self.dates_file,
+                                  progress=None)
+        cache = result_cache.ResultCache(store, self.cache_file)
+        # Without NumPy, format requirements are looked up in the cache.
+        with mock.patch.object(predicates, 'numpy', None):
+            failed_at, _ = predicates.first_failures(store, [Rq('test', requirement)], cache)
+        cache.save()
+        return ([(report_id, k == 1) for report_id, k in zip(store.ids, failed_at)],
+                [(report_id, requirement(store.info(i))) for i, report_id in enumerate(store.ids)])
+
+    def test_removed_report(self):
+        # Three reports which differ only in their format tables, so that
+        # removing the first renumbers the format profiles of the others.
+        self.write_report(1, [(FORMAT_A, SAMPLED), (FORMAT_B, SAMPLED)])
+        self.write_report(2, [(FORMAT_A, SAMPLED)])
+        self.write_report(3, [(FORMAT_B, SAMPLED)])
+        requirement = predicates.FormatFeatures(FORMAT_B, SAMPLED)
+
+        cached, expected = self.passes(requirement)
+        self.assertEqual(cached, expected)
+        self.assertEqual(cached, [(1, True), (2, False), (3, True)])
+
+        os.remove(os.path.join(self.reports_dir, '1.json'))
+        cached, expected = self.passes(requirement)
+        self.assertEqual(cached, expected)
+        self.assertEqual(cached, [(2, False), (3, True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
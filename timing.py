@@ -0,0 +1,181 @@
+# Format this file with python3 -m autopep8 -i timing.py
+
+# Per-stage timing, for query.py --profile.
+#
+# Code worth profiling wraps itself in `with timing.stage(name):`, wraps
+# functions it calls many times with timing.timed(), or adds time it measured
+# itself (e.g. in a worker process) with timing.add(). All of these cost next to
+# nothing unless a profile has been started with timing.start().
+#
+# Stages nest: a stage started inside another is recorded as "outer/inner".
+# summary() has the total wall time and number of calls of every stage and of
+# every requirement, and the peak resident set size. dump() saves the stages
+# as a trace which chrome://tracing and https://ui.perfetto.dev can open.
+
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# The profile being recorded, if any
+_profile = None
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        # [seconds, calls] by (category, name), in the order they started
+        self.totals = {}
+        # Names of the stages currently running, outermost first
+        self.stack = []
+        # Trace events, in the Trace Event Format
+        self.events = []
+
+    def total(self, category, name):
+        if (category, name) not in self.totals:
+            self.totals[(category, name)] = [0.0, 0]
+        return self.totals[(category, name)]
+
+
+class _Stage:
+    '''A context manager timing one run of a stage'''
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.profile.stack.append(self.name)
+        self.path = '/'.join(self.profile.stack)
+        self.total = self.profile.total('stages', self.path)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.total[0] += end - self.start
+        self.total[1] += 1
+        self.profile.stack.pop()
+        self.profile.events.append({
+            'name': self.name, 'cat': self.path, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+            'ts': (self.start - self.profile.started) * 1e6, 'dur': (end - self.start) * 1e6})
+
+
+class _NoStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_no_stage = _NoStage()
+
+
+def start():
+    '''Start recording a profile (discarding any earlier one)'''
+    global _profile
+    _profile = Profile()
+
+
+def enabled():
+    return _profile is not None
+
+
+def stage(name):
+    '''A context manager recording the time spent in a stage'''
+    if _profile is None:
+        return _no_stage
+    return _Stage(_profile, name)
+
+
+def add(name, seconds, calls=1, category='stages'):
+    '''
+    Add time measured elsewhere. Stages are added under the stage currently
+    running.
+    '''
+    if _profile is None:
+        return
+    if category == 'stages':
+        name = '/'.join(_profile.stack + [name])
+    total = _profile.total(category, name)
+    total[0] += seconds
+    total[1] += calls
+
+
+def timed(f, name, category='stages'):
+    '''f, wrapped to add the time spent in each call to name'''
+    if _profile is None:
+        return f
+    if category == 'stages':
+        name = '/'.join(_profile.stack + [name])
+    total = _profile.total(category, name)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            total[0] += time.perf_counter() - start
+            total[1] += 1
+    return wrapper
+
+
+def peak_rss():
+    '''
+    Peak resident set size in bytes of this process, and of the largest of
+    its finished worker processes (None where it can't be measured)
+    '''
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes, except on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def _megabytes(n):
+    return '{:.1f} MB'.format(n / (1 << 20)) if n else 'unknown'
+
+
+def summary():
+    '''The profile recorded so far, as a table'''
+    if _profile is None:
+        return ''
+    wall = time.perf_counter() - _profile.started
+    rss, workers = peak_rss()
+    result = 'Profile: {:.3f}s wall time, peak RSS {} (worker processes {})\n'.format(
+        wall, _megabytes(rss), _megabytes(workers))
+    for category in ('stages', 'requirements'):
+        rows = [(name, seconds, calls)
+                for (c, name), (seconds, calls) in _profile.totals.items() if c == category]
+        if not rows:
+            continue
+        result += '\n  {:>9}  {:>6}  {:>8}  {}\n'.format('seconds', '%', 'calls', category)
+        for name, seconds, calls in rows:
+            result += '  {:9.3f}  {:6.1f}  {:8}  {}\n'.format(
+                seconds, seconds / wall * 100 if wall else 0, calls, name)
+    return result
+
+
+def dump(filename):
+    '''
+    Save the profile as a trace (in the Trace Event Format), with the totals
+    from summary() and the peak RSS as extra top-level members
+    '''
+    rss, workers = peak_rss()
+    trace = {
+        'traceEvents': _profile.events,
+        'displayTimeUnit': 'ms',
+        'wallSeconds': time.perf_counter() - _profile.started,
+        'peakRSS': rss,
+        'peakWorkerRSS': workers,
+        'totals': [{'category': category, 'name': name, 'seconds': seconds, 'calls': calls}
+                   for (category, name), (seconds, calls) in _profile.totals.items()],
+    }
+    with open(filename, 'w') as f:
+        json.dump(trace, f)
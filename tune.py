@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+# Format this file with python3 -m autopep8 -i tune.py
+
+# Keeps the reports loaded while iterating on requirements.
+#
+#   python3 tune.py [--jobs N] [--watch] [script.py [args...]]
+#
+# Loads the report store once, then runs a requirements script (query.py by
+# default) against the copy in memory. Edit the requirement file (see
+# requirement_files.py) or the "Requirements" section of the script and press
+# Enter to run it again, or pass --watch to run it again every time either is
+# saved. Each run prints (and saves) the same report as running the script
+# directly, but without paying to load the reports again.
+#
+# At the prompt:
+#   <Enter>       run the script again
+#   <path>        run a different requirements script
+#   reload        reload the reports from disk (e.g. after fetch-new-data.py)
+#   q             quit
+
+import getopt
+import os
+import runpy
+import sys
+import time
+import traceback
+
+import report_store
+import requirement_files
+
+
+def run_script(script, args):
+    sys.argv = [script] + args
+    start = time.time()
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except KeyboardInterrupt:
+        print('Interrupted')
+    except SystemExit:
+        pass
+    except:
+        traceback.print_exc()
+    print('Ran {} in {:.2f}s'.format(script, time.time() - start))
+
+
+def watched_files(script, args):
+    '''The script, and the requirement files it reads'''
+    files = [a.split('=', 1)[1] for a in args if a.startswith('--requirements=')]
+    files += [a for o, a in zip(args, args[1:]) if o == '--requirements']
+    return [script] + (files or [requirement_files.DEFAULT_FILE])
+
+
+def wait_for_change(files):
+    def mtimes():
+        return [os.stat(f).st_mtime_ns if os.path.exists(f) else None for f in files]
+    before = mtimes()
+    while mtimes() == before:
+        time.sleep(0.2)
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], 'j:w', ['jobs=', 'watch'])
+
+    jobs = 1
+    watch = False
+    for o, a in opts:
+        if o in ('-j', '--jobs'):
+            jobs = int(a)
+        elif o in ('-w', '--watch'):
+            watch = True
+
+    script = args[0] if len(args) else 'query.py'
+    script_args = args[1:]
+
+    report_store.hold(jobs=jobs)
+    # Let requirements scripts import each other, as when run directly.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+
+    run_script(script, script_args)
+    while True:
+        try:
+            if watch:
+                files = watched_files(script, script_args)
+                print('Waiting for changes to {} (Ctrl-C to quit)'.format(', '.join(files)))
+                wait_for_change(files)
+                command = ''
+            else:
+                command = input('tune> ').strip()
+        except (KeyboardInterrupt, EOFError):
+            print()
+            break
+
+        if command == 'q':
+            break
+        elif command == 'reload':
+            report_store.hold(jobs=jobs)
+            continue
+        elif command:
+            script = command
+        run_script(script, script_args)
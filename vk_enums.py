@@ -0,0 +1,147 @@
+# Format this file with python3 -m autopep8 -i vk_enums.py
+
+# Enums from vk.xml, for use in requirements, e.g. vk.Format.D32_SFLOAT or
+# vk.FormatFeature.SAMPLED_IMAGE.
+#
+# Parsing vk.xml takes a while, so the enums extracted from it are cached in
+# cache/vk-enums.pickle, keyed by a hash of vk.xml; it is only parsed again
+# when vk.xml changes (e.g. after updating the submodule). Values added by
+# extensions and aliases (like the _KHR names of promoted formats) are
+# included.
+
+import hashlib
+import os
+import pickle
+import xml.etree.ElementTree as ET
+
+VK_XML = os.path.join('third_party', 'vulkan', 'vk.xml')
+CACHE_FILE = os.path.join('cache', 'vk-enums.pickle')
+CACHE_VERSION = 1
+
+# Attribute of the result: (enum type, prefix and suffix stripped from names)
+ENUMS = {
+    'Format': ('VkFormat', 'VK_FORMAT_', ''),
+    'FormatFeature': ('VkFormatFeatureFlagBits', 'VK_FORMAT_FEATURE_', '_BIT'),
+    'FormatFeature2': ('VkFormatFeatureFlagBits2', 'VK_FORMAT_FEATURE_2_', '_BIT'),
+    # keep the leading underscore
+    'SampleCount': ('VkSampleCountFlagBits', 'VK_SAMPLE_COUNT', '_BIT'),
+}
+
+# Base value of enums added by extensions, see the "Assigning Extension Token
+# Values" section of the Vulkan style guide
+EXTENSION_BASE = 1000000000
+EXTENSION_BLOCK = 1000
+
+# Enums already loaded in this process, by vk.xml hash
+_loaded = {}
+
+
+class dotdict(dict):
+    '''dot.notation access to dictionary attributes'''
+    __getattr__ = dict.get
+    __setattr__ = dict.__setitem__
+    __delattr__ = dict.__delitem__
+
+
+def short_name(name, prefix, suffix):
+    '''
+    Strip the prefix, and the suffix even if it is followed by a vendor tag:
+    VK_FORMAT_FEATURE_2_SAMPLED_IMAGE_BIT_KHR becomes SAMPLED_IMAGE_KHR.
+    '''
+    name = name[len(prefix):]
+    if suffix:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+        head, sep, tag = name.rpartition(suffix + '_')
+        if sep and tag.isalpha():
+            return head + '_' + tag
+    return name
+
+
+def enum_value(e, extnumber=None):
+    '''
+    The value of an <enum> element, or None if it is an alias. extnumber is
+    the number of the enclosing extension, if any.
+    '''
+    if 'value' in e.attrib:
+        return int(e.attrib['value'], 0)
+    if 'bitpos' in e.attrib:
+        return 1 << int(e.attrib['bitpos'])
+    if 'offset' in e.attrib:
+        number = int(e.attrib.get('extnumber', extnumber))
+        value = EXTENSION_BASE + (number - 1) * EXTENSION_BLOCK + int(e.attrib['offset'])
+        return -value if e.attrib.get('dir') == '-' else value
+    return None
+
+
+def parse(vk_xml=VK_XML):
+    '''Extract ENUMS from vk.xml, as {attribute: {short name: value}}'''
+    root = ET.parse(vk_xml).getroot()
+    types = {enum_type: attr for attr, (enum_type, _, _) in ENUMS.items()}
+    values = {attr: {} for attr in ENUMS}
+    aliases = {attr: {} for attr in ENUMS}
+
+    def add(attr, e, extnumber=None):
+        name = e.attrib['name']
+        value = enum_value(e, extnumber)
+        if value is None:
+            aliases[attr][name] = e.attrib['alias']
+        else:
+            values[attr][name] = value
+
+    for enums in root.findall('./enums'):
+        if enums.attrib.get('name') in types:
+            for e in enums.findall('./enum'):
+                add(types[enums.attrib['name']], e)
+    # Core versions and extensions add values to existing enums
+    for parent in root.findall('./feature') + root.findall('./extensions/extension'):
+        extnumber = parent.attrib.get('number')
+        for e in parent.findall('./require/enum[@extends]'):
+            if e.attrib['extends'] in types:
+                add(types[e.attrib['extends']], e, extnumber)
+
+    result = {}
+    for attr, (_, prefix, suffix) in ENUMS.items():
+        resolved = dict(values[attr])
+        for name, target in aliases[attr].items():
+            # Aliases can refer to other aliases
+            while target in aliases[attr]:
+                target = aliases[attr][target]
+            if target in resolved:
+                resolved[name] = resolved[target]
+        result[attr] = {short_name(name, prefix, suffix): value
+                        for name, value in resolved.items()}
+    return result
+
+
+def load(vk_xml=VK_XML, cache_file=CACHE_FILE):
+    '''
+    Load ENUMS as a dotdict of dotdicts, from the cache if it was made from
+    the same vk.xml.
+    '''
+    with open(vk_xml, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    if digest not in _loaded:
+        enums = None
+        try:
+            with open(cache_file, 'rb') as f:
+                state = pickle.load(f)
+            if state['version'] == CACHE_VERSION and state['hash'] == digest:
+                enums = state['enums']
+        except KeyboardInterrupt:
+            raise
+        except:
+            pass
+        if enums is None:
+            enums = parse(vk_xml)
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file + '.tmp', 'wb') as f:
+                pickle.dump({'version': CACHE_VERSION, 'hash': digest, 'enums': enums},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_file + '.tmp', cache_file)
+        _loaded[digest] = enums
+
+    vk = dotdict()
+    for attr, values in _loaded[digest].items():
+        vk[attr] = dotdict(values)
+    return vk